@@ -0,0 +1,110 @@
+import os
+import sys
+import argparse
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import tools.parameters as pr
+from tools.Img_Enhance import (Gamma, Sigmoid, Enhance, Enhance_LUT, Enhance_reference, CLAHE_Enh,
+                               equalize_lut, Enhance_with_hist, update_histogram)
+from tools.image_cache import find_image
+from tools.image_synth import load_patch_map, paste_gray_patches
+
+
+# 读取真实源图（单通道和三通道各一份），目录不存在时只用随机图
+def load_images(image_dir, count):
+    images = []
+    if os.path.isdir(image_dir):
+        names = sorted(os.path.splitext(f)[0] for f in os.listdir(image_dir))[:count]
+        for name in names:
+            path = find_image(image_dir, name)
+            if path is not None:
+                images.append((name, cv2.imread(path, cv2.IMREAD_GRAYSCALE), cv2.imread(path, cv2.IMREAD_COLOR)))
+    return images
+
+def check_enhance(images, seed=0):
+    """Enhance（合成 LUT）与 Enhance_reference（逐步计算）逐位一致，缓存的 CLAHE 与新建对象一致。"""
+    rng = np.random.default_rng(seed)
+
+    # 全部 256 个灰度级：合成表逐项等于 Sigmoid → Gamma，整图结果等于逐步计算
+    levels = np.arange(256, dtype=np.uint8)
+    assert np.array_equal(Enhance_LUT(1.5), Gamma(Sigmoid(levels), 1.5)), "Enhance_LUT 与 Sigmoid+Gamma 不一致"
+    cases = [("levels", levels.reshape(16, 16)),
+             ("constant", np.full((32, 32), 77, dtype=np.uint8)),
+             ("sparse", rng.choice(np.array([0, 3, 128, 200, 255], dtype=np.uint8), (64, 80))),
+             ("random", rng.integers(0, 256, (97, 131), dtype=np.uint8)),
+             ("bgr", rng.integers(0, 256, (97, 131, 3), dtype=np.uint8))]
+    for name, gray, bgr in images:
+        cases += [(name, gray), (name + " bgr", bgr)]
+    for name, image in cases:
+        assert np.array_equal(Enhance(image), Enhance_reference(image)), f"Enhance 与原实现不一致: {name}"
+
+    # 缓存的 CLAHE 对象反复使用（不同尺寸交替）与每次新建的结果相同
+    outputs = [Enhance(image) for _, image in cases]
+    for _ in range(2):
+        for out in outputs:
+            fresh = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(out)
+            assert np.array_equal(CLAHE_Enh(out), fresh), "缓存的 CLAHE 与新建对象结果不一致"
+    return len(cases)
+
+def calc_hist(image):
+    return cv2.calcHist([image], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+
+def check_incremental(images, label_dir, patch_map, seed=0):
+    """在真实源图上粘贴 gray patch：增量更新的直方图等于 calcHist，
+    equalize_lut 经 cv2.LUT 的结果等于 cv2.equalizeHist，Enhance_with_hist 等于 Enhance。"""
+    rng = np.random.default_rng(seed)
+    count = 0
+    for name, src, _ in images:
+        label_path = os.path.join(label_dir, name + ".txt")
+        if not os.path.exists(label_path):
+            continue
+        with open(label_path, 'r') as f:
+            lines = [line.split() for line in f if line.strip()]
+        # 另加一批随机框：互相重叠、部分越过图像边界
+        extra = [["1", f"{x:.6f}", f"{y:.6f}"] for x, y in rng.uniform(0.0, 1.0, (40, 2))]
+        for sample in (lines, lines + extra, lines + lines):
+            img = src.copy()
+            rects = []
+            paste_gray_patches(img, sample, patch_map, name, rects)
+            hist = update_histogram(calc_hist(src), src, img, rects)
+            assert np.array_equal(hist, calc_hist(img)), f"增量直方图与 calcHist 不一致: {name}"
+
+            enhanced = cv2.LUT(img, Enhance_LUT(1.5))
+            for image, image_hist in ((img, hist), (enhanced, calc_hist(enhanced))):
+                assert np.array_equal(cv2.LUT(image, equalize_lut(image_hist)), cv2.equalizeHist(image)), \
+                    f"equalize_lut 与 equalizeHist 不一致: {name}"
+            assert np.array_equal(Enhance_with_hist(img, hist), Enhance(img)), f"Enhance_with_hist 不一致: {name}"
+            count += 1
+
+    for image in (np.full((16, 16), 9, dtype=np.uint8), np.zeros((3, 5), dtype=np.uint8)):
+        assert np.array_equal(cv2.LUT(image, equalize_lut(calc_hist(image))), cv2.equalizeHist(image)), \
+            "equalize_lut 与 equalizeHist 不一致: 单一灰度"
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="核对快速增强路径与原实现逐位一致")
+    parser.add_argument('--image_dir', type=str, default=os.path.join(ROOT, "dataset_unmod/data_unenh_pruned"),
+                        help='真实源图目录')
+    parser.add_argument('--label_dir', type=str, default=os.path.join(ROOT, "dataset_labels/labels_all"),
+                        help='源图对应的标签目录（增量直方图核对）')
+    parser.add_argument('--patch_root', type=str, default=os.path.join(ROOT, "patches_texture"), help='patch 目录')
+    parser.add_argument('--count', type=int, default=8, help='使用的源图数量')
+    args = parser.parse_args(argv)
+
+    images = load_images(args.image_dir, args.count)
+    n = check_enhance(images)
+    print(f"[OK] Enhance / CLAHE: {n} 组输入逐位一致")
+
+    patch_map = load_patch_map(args.patch_root, pr.w_b, pr.h_b, pr.w_g, pr.h_g,
+                               pr.replacement_left_gray, pr.replacement_right_gray, gray=True)
+    n = check_incremental(images, args.label_dir, patch_map)
+    if n == 0:
+        print("[Warn] 没有找到带标签的真实源图，增量直方图只核对了单一灰度图")
+    print(f"[OK] 增量直方图均衡化: {n} 张合成图与 equalizeHist / calcHist 逐位一致")
+
+
+if __name__ == "__main__":
+    main()
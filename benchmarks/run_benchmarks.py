@@ -0,0 +1,320 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import tools.parameters as pr
+from tools.Img_Enhance import Enhance, Enhance_reference, Enhance_with_hist, CLAHE_Enh
+from tools.image_synth import load_patch_map, paste_gray_patches, paste_bright_patches
+from tools.label_sampler import CombinationSampler, sample_valid_combination, sample_rng
+from tools.label_store import LABEL_DTYPE
+from tools.modify_w_h import modify_wh_by_direction, apply_wh_by_direction
+from tools.xray_noise import add_poisson_gaussian_noise, add_noise_levels, noise_levels
+import random_data_split
+import lama_gen
+
+# ---------- 合成测试数据 ----------
+
+class Fixture:
+    """在临时目录中生成单通道测试数据：count 张 size×size 的源图、每张图的 gray / bright 候选点，
+    以及 combos 个组合样本（图像 + 标签），编号 1..count 与 random_data_split 的固定分组对应。"""
+
+    def __init__(self, root, size=1245, count=8, combos=4, pool=60, seed=0):
+        self.root = root
+        self.size = size
+        self.ids = [str(i) for i in range(1, min(count, 44) + 1)]
+        rng = np.random.default_rng(seed)
+
+        self.image_dir = os.path.join(root, "images")
+        self.sample_dir = os.path.join(root, "samples")
+        self.label_dir = os.path.join(root, "labels")
+        for d in (self.image_dir, self.sample_dir, self.label_dir):
+            os.makedirs(d, exist_ok=True)
+
+        # 平滑的强度渐变 + 噪声，压缩率与真实 X 光图接近，不是纯随机噪声
+        yy, xx = np.mgrid[0:size, 0:size].astype(np.float32) / max(size - 1, 1)
+        self.images, self.pools, self.samples = {}, {}, {}
+        for img_id in self.ids:
+            base = 60 + 120 * (0.5 * xx + 0.5 * yy * rng.random())
+            img = np.clip(base + rng.normal(0, 12, (size, size)), 0, 255).astype(np.uint8)
+            self.images[img_id] = img
+            cv2.imwrite(os.path.join(self.image_dir, img_id + ".png"), img)
+
+            def points(cls):
+                rec = np.zeros(pool, dtype=LABEL_DTYPE)
+                rec['cls'] = cls
+                rec['x'], rec['y'] = rng.uniform(0.05, 0.95, pool), rng.uniform(0.05, 0.95, pool)
+                rec['w'], rec['h'] = pr.w_l, pr.h_l
+                return rec
+            self.pools[img_id] = (points(1), points(0))
+
+            sampler = CombinationSampler(*self.pools[img_id], pr.gray_count, pr.bright_count,
+                                         pr.min_manhattan_distance)
+            for k in range(combos):
+                name = f"{img_id}_{k}"
+                records = sampler.sample(sample_rng(seed, img_id, k))
+                if records is None:
+                    continue
+                records = apply_wh_by_direction(records, pr.w_l, pr.h_l)
+                self.samples[name] = records
+                cv2.imwrite(os.path.join(self.sample_dir, name + ".png"), img)
+                with open(os.path.join(self.label_dir, name + ".txt"), 'w') as f:
+                    f.write("".join(f"{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n"
+                                    for c, x, y, w, h in records.tolist()))
+
+    def lama_root(self):
+        """images/labels 按 train/valid/test 分目录（符号链接到样本），供 generate_directional_masks 使用。"""
+        root = os.path.join(self.root, "lama")
+        if not os.path.exists(root):
+            for i, name in enumerate(sorted(self.samples)):
+                subset = ("train", "valid", "test")[i % 3]
+                for kind, src_dir, ext in (("images", self.sample_dir, ".png"), ("labels", self.label_dir, ".txt")):
+                    d = os.path.join(root, kind, subset)
+                    os.makedirs(d, exist_ok=True)
+                    os.symlink(os.path.join(src_dir, name + ext), os.path.join(d, name + ext))
+        return root
+
+# ---------- 基准定义 ----------
+# 每个基准返回 dict(run=可调用, items=每次处理的条目数, nbytes=可选的数据量, setup=可选的每轮准备)
+
+BENCHMARKS = OrderedDict()
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+def _pixels(fx):
+    return sum(img.nbytes for img in fx.images.values())
+
+@benchmark("sampler_legacy")
+def bench_sampler_legacy(fx, args):
+    pools = [(g.tolist(), b.tolist()) for g, b in fx.pools.values()]
+    def run():
+        for g, b in pools:
+            for _ in range(args.combos):
+                sample_valid_combination(g, b, pr.gray_count, pr.bright_count, pr.min_manhattan_distance)
+    return dict(run=run, items=len(pools) * args.combos)
+
+def _bench_sampler(fx, args, sampler):
+    def run():
+        for img_id, (g, b) in fx.pools.items():
+            pool = CombinationSampler(g, b, pr.gray_count, pr.bright_count, pr.min_manhattan_distance, sampler)
+            for k in range(args.combos):
+                pool.sample(sample_rng(0, img_id, k))
+    return dict(run=run, items=len(fx.pools) * args.combos)
+
+@benchmark("sampler_numpy")
+def bench_sampler_numpy(fx, args):
+    return _bench_sampler(fx, args, "numpy")
+
+@benchmark("sampler_constructive")
+def bench_sampler_constructive(fx, args):
+    return _bench_sampler(fx, args, "constructive")
+
+@benchmark("modify_wh_by_direction")
+def bench_modify_wh(fx, args):
+    label_dir = os.path.join(fx.root, "wh_labels")
+    def setup():
+        shutil.rmtree(label_dir, ignore_errors=True)
+        shutil.copytree(fx.label_dir, label_dir)
+    return dict(run=lambda: modify_wh_by_direction(label_dir, pr.w_l, pr.h_l), setup=setup, items=len(fx.samples))
+
+@benchmark("apply_wh_by_direction")
+def bench_apply_wh(fx, args):
+    records = list(fx.samples.values())
+    return dict(run=lambda: [apply_wh_by_direction(r, pr.w_l, pr.h_l) for r in records], items=len(records))
+
+def _patch_map():
+    return load_patch_map(os.path.join(ROOT, "patches_texture"), pr.w_b, pr.h_b, pr.w_g, pr.h_g,
+                          pr.replacement_left_gray, pr.replacement_right_gray, gray=True)
+
+@benchmark("paste_patches")
+def bench_paste_patches(fx, args):
+    patch_map = _patch_map()
+    work = [(fx.images[name.split("_")[0]], records.tolist()) for name, records in fx.samples.items()]
+    def run():
+        for img, lines in work:
+            paste_bright_patches(paste_gray_patches(img.copy(), lines, patch_map), lines, patch_map)
+    return dict(run=run, items=len(work))
+
+@benchmark("enhance_reference")
+def bench_enhance_reference(fx, args):
+    images = list(fx.images.values())
+    return dict(run=lambda: [Enhance_reference(img) for img in images], items=len(images), nbytes=_pixels(fx))
+
+@benchmark("enhance")
+def bench_enhance(fx, args):
+    images = list(fx.images.values())
+    return dict(run=lambda: [Enhance(img) for img in images], items=len(images), nbytes=_pixels(fx))
+
+@benchmark("enhance_incremental")
+def bench_enhance_incremental(fx, args):
+    images = list(fx.images.values())
+    hists = [np.bincount(img.ravel(), minlength=256) for img in images]
+    return dict(run=lambda: [Enhance_with_hist(img, h) for img, h in zip(images, hists)],
+                items=len(images), nbytes=_pixels(fx))
+
+@benchmark("clahe")
+def bench_clahe(fx, args):
+    images = list(fx.images.values())
+    return dict(run=lambda: [CLAHE_Enh(img) for img in images], items=len(images), nbytes=_pixels(fx))
+
+def _bench_split(fx, args, mode):
+    out = os.path.join(fx.root, f"split_{mode}")
+    def setup():
+        shutil.rmtree(out, ignore_errors=True)
+    def run():
+        random_data_split.copy_and_split(fx.sample_dir, fx.label_dir, os.path.join(out, "images"),
+                                         os.path.join(out, "labels"), materialize=mode)
+    nbytes = sum(os.path.getsize(os.path.join(fx.sample_dir, f)) for f in os.listdir(fx.sample_dir))
+    return dict(run=run, setup=setup, items=len(fx.samples), nbytes=nbytes)
+
+@benchmark("copy_and_split")
+def bench_copy_and_split(fx, args):
+    return _bench_split(fx, args, "copy")
+
+@benchmark("copy_and_split_hardlink")
+def bench_copy_and_split_hardlink(fx, args):
+    return _bench_split(fx, args, "hardlink")
+
+@benchmark("generate_directional_masks")
+def bench_masks(fx, args):
+    root = fx.lama_root()
+    return dict(run=lambda: lama_gen.generate_directional_masks(root, w_b=15, h_b=15, w_g=25, h_g=40),
+                items=len(fx.samples))
+
+@benchmark("add_poisson_gaussian_noise")
+def bench_noise(fx, args):
+    images = list(fx.images.values())
+    _, alpha, sigma2 = noise_levels[2]
+    rng = np.random.default_rng(0)
+    return dict(run=lambda: [add_poisson_gaussian_noise(img, alpha, sigma2, rng=rng) for img in images],
+                items=len(images), nbytes=_pixels(fx))
+
+@benchmark("add_noise_levels")
+def bench_noise_levels(fx, args):
+    images = list(fx.images.values())
+    return dict(run=lambda: [add_noise_levels(img, noise_levels, 0, str(i)) for i, img in enumerate(images)],
+                items=len(images), nbytes=_pixels(fx))
+
+# ---------- 测量 ----------
+
+def measure(spec, repeat):
+    """最快一次的耗时（不开 tracemalloc），再单独跑一次记录 Python / numpy 分配的峰值内存。"""
+    setup = spec.get("setup") or (lambda: None)
+    quiet = io.StringIO()
+    best = float("inf")
+    with contextlib.redirect_stdout(quiet), contextlib.redirect_stderr(quiet):
+        for _ in range(repeat):
+            setup()
+            t0 = time.perf_counter()
+            spec["run"]()
+            best = min(best, time.perf_counter() - t0)
+        setup()
+        tracemalloc.start()
+        spec["run"]()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    result = {"seconds": best, "items": spec["items"], "items_per_s": spec["items"] / best,
+              "peak_mb": peak / (1024 * 1024)}
+    if spec.get("nbytes"):
+        result["mb_per_s"] = spec["nbytes"] / best / (1024 * 1024)
+    return result
+
+# 影响测试数据规模和计时方式的参数，比较时要求一致
+FIXTURE_ARGS = ("size", "count", "combos", "repeat", "seed")
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(results, baseline, threshold):
+    """与基线 JSON 比较耗时，返回变慢超过 threshold 的基准名列表。"""
+    regressions = []
+    print(f"\n{'benchmark':<28} {'base(s)':>10} {'now(s)':>10} {'ratio':>7}")
+    for name, r in results.items():
+        old = baseline.get("results", {}).get(name)
+        if old is None:
+            continue
+        ratio = r["seconds"] / old["seconds"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            flag = "  ⚠️ 变慢"
+        print(f"{name:<28} {old['seconds']:>10.4f} {r['seconds']:>10.4f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="流水线各阶段的基准测试（合成单通道测试数据）")
+    parser.add_argument('--size', type=int, default=1245, help='测试图像边长')
+    parser.add_argument('--count', type=int, default=8, help='源图数量（最多 44，对应固定分组编号）')
+    parser.add_argument('--combos', type=int, default=4, help='每张源图的组合样本数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数（取最快一次）')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='只运行这些基准')
+    parser.add_argument('--output', type=str, default=None,
+                        help='结果 JSON 路径（默认 benchmarks/results/<git 版本>.json）')
+    parser.add_argument('--compare', type=str, default=None, help='与之前保存的结果 JSON 比较')
+    parser.add_argument('--threshold', type=float, default=0.10, help='耗时增加超过该比例视为变慢')
+    parser.add_argument('--fail_on_regression', action='store_true', help='有基准变慢时返回非零退出码')
+    parser.add_argument('--seed', type=int, default=0, help='测试数据随机种子')
+    args = parser.parse_args(argv)
+
+    revision = git_revision()
+    names = args.only or list(BENCHMARKS)
+    results = OrderedDict()
+    with tempfile.TemporaryDirectory(prefix="yolo_bench_") as tmp:
+        t0 = time.perf_counter()
+        fx = Fixture(tmp, size=args.size, count=args.count, combos=args.combos, seed=args.seed)
+        print(f"[Fixture] {len(fx.images)} 张源图 {args.size}×{args.size}，{len(fx.samples)} 个组合样本"
+              f"（{time.perf_counter() - t0:.1f}s）")
+        print(f"{'benchmark':<28} {'seconds':>10} {'items/s':>10} {'MB/s':>9} {'peak MB':>9}")
+        for name in names:
+            r = measure(BENCHMARKS[name](fx, args), args.repeat)
+            results[name] = r
+            mbps = f"{r['mb_per_s']:.1f}" if "mb_per_s" in r else "-"
+            print(f"{name:<28} {r['seconds']:>10.4f} {r['items_per_s']:>10.1f} {mbps:>9} {r['peak_mb']:>9.1f}")
+
+    report = {
+        "meta": {"revision": revision, "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(), "numpy": np.__version__, "opencv": cv2.__version__,
+                 "platform": platform.platform(), "cpus": os.cpu_count(),
+                 "args": {k: getattr(args, k) for k in FIXTURE_ARGS}},
+        "results": results,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print(f"[OK] 结果已保存: {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("args", {}) != report["meta"]["args"]:
+            print("[Warn] 基线的测试参数不同，比较结果仅供参考")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,31 @@
 import os
-import shutil
+import json
+import argparse
 from tqdm import tqdm
+from tools.materialize import KEEP_SOURCE_MODES, MaterializeStats
+from lama_gen import generate_directional_masks
+
+# 输出目录下的清单：输出文件名 → 源文件（绝对路径），记录哪些文件内容相同
+MANIFEST_NAME = "lama_manifest.json"
+
+# 同一源图要放多份，move 不适用
+LAMA_MATERIALIZE_MODES = KEEP_SOURCE_MODES
 
 def generate_augmented_images_and_collect_masks(
     base_image_dir,         # 编号图像路径，如 'dataset_mod/'
     yolo_dataset_dir,       # YOLO 数据集根目录，如 'dataset_0_bk/YOLO_data_7_22_3_p'
-    output_dir              # 输出目录，如 'final_output/'
+    output_dir,             # 输出目录，如 'final_output/'
+    materialize="copy",     # 图像/mask 放入输出目录的方式，见 tools/materialize.py
+    masks="copy",           # copy: 收集 yolo_dataset_dir/masks 下已生成的 mask；generate: 直接生成到输出目录
+    mask_sizes=(15, 15, 25, 40),  # masks="generate" 时的 (w_b, h_b, w_g, h_g)
+    workers=1               # masks="generate" 时的并行进程数
 ):
+    """同一编号的所有后缀图像内容相同：hardlink / reflink / symlink 模式下每个编号只占一份数据，
+    输出文件名到源文件的对应关系写入 lama_manifest.json。"""
+    if materialize not in LAMA_MATERIALIZE_MODES:
+        raise ValueError(f"不支持的 materialize 方式: {materialize}")
     os.makedirs(output_dir, exist_ok=True)
+    manifest = {}
 
     # Step 1: 收集YOLO数据集中的所有图像后缀
     suffix_list = []
@@ -27,6 +45,7 @@ def generate_augmented_images_and_collect_masks(
 
     # Step 2: 给 1~44 编号图片添加后缀，并保存新图像
     print("🔄 正在生成带后缀的新图像...")
+    image_stats = MaterializeStats(materialize)
     for i in tqdm(range(1, 45)):
         src_path = os.path.join(base_image_dir, f"{i}.png")
         if not os.path.exists(src_path):
@@ -34,28 +53,50 @@ def generate_augmented_images_and_collect_masks(
             continue
         for suffix in suffix_list:
             dst_filename = f"{i}{suffix}.png"
-            dst_path = os.path.join(output_dir, dst_filename)
-            shutil.copy(src_path, dst_path)
+            image_stats(src_path, os.path.join(output_dir, dst_filename))
+            manifest[dst_filename] = os.path.abspath(src_path)
+    print(f"   {image_stats.summary()}")
 
-    # Step 3: 将 masks/train|valid|test 中的所有图像 flatten 到输出目录
-    print("📥 正在收集 mask 图像...")
-    for subset in ['train', 'valid', 'test']:
-        mask_dir = os.path.join(yolo_dataset_dir, 'masks', subset)
-        if not os.path.exists(mask_dir):
-            continue
-        for f in os.listdir(mask_dir):
-            if f.lower().endswith('.png'):
-                src = os.path.join(mask_dir, f)
-                dst = os.path.join(output_dir, f)
-                shutil.copy(src, dst)
+    # Step 3: mask 放入输出目录（平铺）
+    if masks == "generate":
+        print("🎭 正在直接生成 mask 到输出目录...")
+        generate_directional_masks(yolo_dataset_dir, *mask_sizes, workers=workers, mask_root=output_dir)
+    else:
+        print("📥 正在收集 mask 图像...")
+        mask_stats = MaterializeStats(materialize)
+        for subset in ['train', 'valid', 'test']:
+            mask_dir = os.path.join(yolo_dataset_dir, 'masks', subset)
+            if not os.path.exists(mask_dir):
+                continue
+            for f in os.listdir(mask_dir):
+                if f.lower().endswith('.png'):
+                    src = os.path.join(mask_dir, f)
+                    mask_stats(src, os.path.join(output_dir, f))
+                    manifest[f] = os.path.abspath(src)
+        print(f"   {mask_stats.summary()}")
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
 
     print("✅ 所有图像已成功处理并保存至:", output_dir)
+    return manifest
 
 
 # ========== 使用示例 ==========
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="组装 LAMA 数据集（带后缀的原图 + mask）")
+    parser.add_argument('--materialize', choices=LAMA_MATERIALIZE_MODES, default='copy',
+                        help='图像/mask 放入输出目录的方式；hardlink / reflink / symlink 时相同内容只占一份空间')
+    parser.add_argument('--masks', choices=['copy', 'generate'], default='copy',
+                        help='copy: 收集已生成的 mask；generate: 由 lama_gen 直接生成到输出目录')
+    parser.add_argument('--workers', type=int, default=1, help='--masks generate 时的并行进程数')
+    args = parser.parse_args()
+
     generate_augmented_images_and_collect_masks(
         base_image_dir="dataset_mod",  # 原始 1.png ~ 44.png 所在目录
         yolo_dataset_dir="dataset_0_bk/YOLO_data_7_22_3_p",  # YOLO数据集路径
-        output_dir="final_output"  # 输出目录（统一收集）
+        output_dir="final_output",  # 输出目录（统一收集）
+        materialize=args.materialize,
+        masks=args.masks,
+        workers=args.workers
     )
@@ -1,7 +1,10 @@
 import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 import cv2
 import numpy as np
 from tqdm import tqdm
+from tools.image_cache import png_size
 
 # 判定方向函数
 def judge_direction(x, y):
@@ -12,72 +15,167 @@ def judge_direction(x, y):
     else:
         return 3 if x < 0.5 else 1  # 左 or 右
 
+# 标签行 → 每个框的填充范围 (x_lo, y_lo, x_hi, y_hi)，闭区间，已裁剪到图像内
+# 与逐行 cv2.rectangle 的规则一致：只取 5 列的行，类别字符串含 '0' 为 bright、含 '1' 为 gray
+def box_extents(lines, h, w, w_b, h_b, w_g, h_g):
+    rows = [line.split() for line in lines]
+    rows = [parts for parts in rows if len(parts) == 5]
+    is_b = np.array(['0' in parts[0].lower() for parts in rows], dtype=bool)
+    is_g = np.array([('1' in parts[0].lower()) for parts in rows], dtype=bool) & ~is_b
+    keep = is_b | is_g
+    if not keep.any():
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    cx = np.array([float(parts[1]) for parts in rows])[keep]
+    cy = np.array([float(parts[2]) for parts in rows])[keep]
+    is_b = is_b[keep]
+
+    box_w = np.where(is_b, w_b, w_g).astype(np.float64)
+    box_h = np.where(is_b, h_b, h_g).astype(np.float64)
+    dx, dy = cx - 0.5, cy - 0.5
+    sideways = np.abs(dy) <= np.abs(dx)  # judge_direction 为 1 / 3（左右）
+    box_w, box_h = np.where(sideways, box_h, box_w), np.where(sideways, box_w, box_h)
+
+    x1 = np.trunc(cx * w - box_w / 2).astype(np.int64)
+    y1 = np.trunc(cy * h - box_h / 2).astype(np.int64)
+    x2 = np.trunc(cx * w + box_w / 2).astype(np.int64)
+    y2 = np.trunc(cy * h + box_h / 2).astype(np.int64)
+    x1, y1 = np.maximum(0, x1), np.maximum(0, y1)
+    x2, y2 = np.minimum(w - 1, x2), np.minimum(h - 1, y2)
+
+    # cv2.rectangle 不区分两个角的先后，并且只画图像内的部分
+    x_lo = np.maximum(np.minimum(x1, x2), 0)
+    x_hi = np.minimum(np.maximum(x1, x2), w - 1)
+    y_lo = np.maximum(np.minimum(y1, y2), 0)
+    y_hi = np.minimum(np.maximum(y1, y2), h - 1)
+    inside = (x_lo <= x_hi) & (y_lo <= y_hi)
+    return x_lo[inside], y_lo[inside], x_hi[inside], y_hi[inside]
+
+# 一个文件的全部框一次算出范围后填充；框很少，逐个切片赋值比整幅的差分累加更快
+def rasterize_boxes(lines, h, w, w_b, h_b, w_g, h_g):
+    mask = np.zeros((h, w), dtype=np.uint8)
+    for x_lo, y_lo, x_hi, y_hi in zip(*(v.tolist() for v in box_extents(lines, h, w, w_b, h_b, w_g, h_g))):
+        mask[y_lo:y_hi + 1, x_lo:x_hi + 1] = 255
+    return mask
+
+# 原逐行 cv2.rectangle 实现，用于核对
+def rasterize_boxes_reference(lines, h, w, w_b, h_b, w_g, h_g):
+    mask = np.zeros((h, w), dtype=np.uint8)
+    for line in lines:
+        parts = line.strip().split()
+        if len(parts) != 5:
+            continue
+
+        cls, cx, cy, _, _ = parts
+        cx = float(cx)
+        cy = float(cy)
+        direction = judge_direction(cx, cy)
+
+        if '0' in cls.lower():
+            box_w = w_b
+            box_h = h_b
+        elif '1' in cls.lower():
+            box_w = w_g
+            box_h = h_g
+        else:
+            continue
+
+        if direction in [1, 3]:  # 左右
+            box_w, box_h = box_h, box_w
+
+        x1 = int(cx * w - box_w / 2)
+        y1 = int(cy * h - box_h / 2)
+        x2 = int(cx * w + box_w / 2)
+        y2 = int(cy * h + box_h / 2)
+
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(w - 1, x2), min(h - 1, y2)
+
+        cv2.rectangle(mask, (x1, y1), (x2, y2), 255, thickness=-1)
+    return mask
+
+# 图像尺寸：优先读 PNG 文件头，其次源图缓存（合成图与源图同尺寸），最后才完整解码
+def image_hw(img_path, img_name, source_cache=None):
+    if img_path.lower().endswith('.png'):
+        size = png_size(img_path)
+        if size is not None:
+            return size
+    img = None
+    if source_cache is not None:
+        img = source_cache.get(img_name.split('_')[0])
+    if img is None:
+        img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    return None if img is None else img.shape[:2]
+
+_mask_args = {}
+
+def _init_mask_worker(args):
+    _mask_args.update(args)
+
+# 生成单个 mask；返回 None 或 (文件, 错误信息)
+def _mask_task(img_path, label_path, mask_path):
+    a = _mask_args
+    img_name = os.path.basename(img_path)
+    hw = image_hw(img_path, img_name, a.get("source_cache"))
+    if hw is None:
+        return img_path, "无效图像"
+    h, w = hw
+    lines = []
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as f:
+            lines = f.readlines()
+    sizes = (a["w_b"], a["h_b"], a["w_g"], a["h_g"])
+    mask = rasterize_boxes(lines, h, w, *sizes)
+    if a["check"] and not np.array_equal(mask, rasterize_boxes_reference(lines, h, w, *sizes)):
+        return img_path, "mask 与逐行 cv2.rectangle 结果不一致"
+    if not cv2.imwrite(mask_path, mask, [cv2.IMWRITE_PNG_COMPRESSION, a["compression"]]):
+        return img_path, "写入失败"
+    return None
+
 # 生成 mask 主函数
-def generate_directional_masks(image_root, w_b=15, h_b=15, w_g=15, h_g=40):
+# source_cache: 可选的 SourceImageCache（源图目录），只在图像不是 PNG（读不到文件头）时用来取尺寸
+# workers: 并行进程数，所有子集的文件一起分配
+# compression: PNG 压缩级别（0-9），mask 几乎全是 0，低级别已足够小且编码快得多
+# check: 每张 mask 同时用原逐行实现生成一遍并核对（调试用）
+# mask_root: 给定时所有子集的 mask 直接写入该目录（平铺），默认写入 image_root/masks/<子集>
+def generate_directional_masks(image_root, w_b=15, h_b=15, w_g=15, h_g=40, source_cache=None,
+                               workers=1, compression=1, check=False, mask_root=None):
     subsets = ['train', 'valid', 'test']
+    tasks = []
     for subset in subsets:
         image_dir = os.path.join(image_root, 'images', subset)
+        if not os.path.exists(image_dir):
+            continue
         label_dir = os.path.join(image_root, 'labels', subset)
-        mask_dir = os.path.join(image_root, 'masks', subset)
+        mask_dir = os.path.join(image_root, 'masks', subset) if mask_root is None else mask_root
         os.makedirs(mask_dir, exist_ok=True)
 
         image_files = [f for f in os.listdir(image_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        for img_name in image_files:
+            stem = os.path.splitext(img_name)[0]
+            tasks.append((os.path.join(image_dir, img_name),
+                          os.path.join(label_dir, stem + '.txt'),
+                          os.path.join(mask_dir, stem + '_mask001.png')))
+
+    args = {"w_b": w_b, "h_b": h_b, "w_g": w_g, "h_g": h_g, "compression": compression, "check": check}
+    failures = []
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_mask_worker, initargs=(args,)) as ex:
+            results = ex.map(_mask_task, *zip(*tasks), chunksize=max(1, len(tasks) // (workers * 8)))
+            failures = [r for r in tqdm(results, total=len(tasks), desc='Masks') if r is not None]
+    else:
+        _init_mask_worker(dict(args, source_cache=source_cache))
+        failures = [r for r in (_mask_task(*t) for t in tqdm(tasks, desc='Masks')) if r is not None]
 
-        for img_name in tqdm(image_files, desc=f'Processing {subset}'):
-            img_path = os.path.join(image_dir, img_name)
-            label_path = os.path.join(label_dir, os.path.splitext(img_name)[0] + '.txt')
-            mask_path = os.path.join(mask_dir, os.path.splitext(img_name)[0] + '_mask001.png')
-
-            img = cv2.imread(img_path)
-            if img is None:
-                print(f"⚠️ 跳过无效图像: {img_path}")
-                continue
-            h, w = img.shape[:2]
-            mask = np.zeros((h, w), dtype=np.uint8)
-
-            if not os.path.exists(label_path):
-                cv2.imwrite(mask_path, mask)
-                continue
-
-            with open(label_path, 'r') as f:
-                lines = f.readlines()
-
-            for line in lines:
-                parts = line.strip().split()
-                if len(parts) != 5:
-                    continue
-
-                cls, cx, cy, _, _ = parts
-                cx = float(cx)
-                cy = float(cy)
-                direction = judge_direction(cx, cy)
-
-                if '0' in cls.lower():
-                    box_w = w_b
-                    box_h = h_b
-                elif '1' in cls.lower():
-                    box_w = w_g
-                    box_h = h_g
-                else:
-                    continue
-
-                if direction in [1, 3]:  # 左右
-                    box_w, box_h = box_h, box_w
-
-                x1 = int(cx * w - box_w / 2)
-                y1 = int(cy * h - box_h / 2)
-                x2 = int(cx * w + box_w / 2)
-                y2 = int(cy * h + box_h / 2)
-
-                x1, y1 = max(0, x1), max(0, y1)
-                x2, y2 = min(w - 1, x2), min(h - 1, y2)
-
-                cv2.rectangle(mask, (x1, y1), (x2, y2), 255, thickness=-1)
-
-            cv2.imwrite(mask_path, mask)
+    for img_path, error in failures:
+        print(f"⚠️ 跳过: {img_path}（{error}）")
+    return failures
 
 # ========== 用法 ==========
 if __name__ == "__main__":
-    dataset_root = "dataset_0_bk/LAMA"  # 替换为你的路径
-    output_root = "dataset_0_bk/LAMA/masks"  # 替换为你的路径
-    generate_directional_masks(dataset_root, w_b=15, h_b=15, w_g=25, h_g=40)
+    parser = argparse.ArgumentParser(description="按标签生成 LAMA 方向 mask")
+    parser.add_argument('--root', default="dataset_0_bk/LAMA", help='包含 images/ labels/ 的数据集根目录')
+    parser.add_argument('--workers', type=int, default=1, help='并行进程数')
+    parser.add_argument('--check', action='store_true', help='与原逐行 cv2.rectangle 实现逐张核对')
+    args = parser.parse_args()
+    generate_directional_masks(args.root, w_b=15, h_b=15, w_g=25, h_g=40, workers=args.workers, check=args.check)
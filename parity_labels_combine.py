@@ -1,6 +1,8 @@
 import os
 import shutil
 import tools.parameters as pr
+from tools.modify_w_h import format_lines_by_direction
+from tools.label_store import LabelStore
 w_l = pr.w_l
 h_l = pr.h_l
 
@@ -50,19 +52,22 @@ def classify_point(x, y):
     else:  # 左/右
         return h_l, w_l
 
-# 修改并拆分 label
-def process_and_split_labels(input_dir, output_dir):
+# 修改并拆分 label：w/h 在写出前按方向直接确定，每个文件只写一次
+# only: 只处理这些合并后的文件（如 {"9_g"}），None 表示全部
+def process_and_split_labels(input_dir, output_dir, only=None):
     os.makedirs(output_dir, exist_ok=True)
 
     for fname in os.listdir(input_dir):
         if not fname.endswith(".txt") or fname == "classes.txt":
             continue
+        if only is not None and os.path.splitext(fname)[0] not in only:
+            continue
 
         input_path = os.path.join(input_dir, fname)
         with open(input_path, 'r') as f:
             lines = f.readlines()
 
-        new_lines = []
+        cls_list, xs, ys = [], [], []
 
         for line in lines:
             parts = line.strip().split()
@@ -72,34 +77,27 @@ def process_and_split_labels(input_dir, output_dir):
             cls, x, y = int(parts[0]), float(parts[1]), float(parts[2])
 
             if fname.endswith("_b.txt"):
-                w, h = classify_point(x, y)
-                new_line = f"{cls} {x:.6f} {y:.6f} {w:.6f} {h:.6f}"
-
+                cls = str(cls)
             elif fname.endswith("_g.txt"):
-                if len(parts) == 5:
-                    w, h = float(parts[3]), float(parts[4])
-                else:
-                    w, h = w_l, h_l  # 默认尺寸
-
-                new_line = f"1 {x:.6f} {y:.6f} {w:.6f} {h:.6f}"
-
+                cls = "1"
             else:
-                new_line = line.strip()
+                cls = parts[0]
+
+            if fname.endswith(("_b.txt", "_g.txt")):
+                # 与原先先按 6 位小数写出、再读回的数值保持一致
+                x, y = float(f"{x:.6f}"), float(f"{y:.6f}")
 
-            new_lines.append(new_line)
+            cls_list.append(cls)
+            xs.append(x)
+            ys.append(y)
 
         # 拆分成奇偶行
         base_name = os.path.splitext(fname)[0]
-        even_lines = [l for i, l in enumerate(new_lines) if i % 2 == 0]
-        odd_lines  = [l for i, l in enumerate(new_lines) if i % 2 == 1]
-
-        out_even = os.path.join(output_dir, base_name + "_0.txt")
-        out_odd  = os.path.join(output_dir, base_name + "_1.txt")
-
-        with open(out_even, 'w') as f:
-            f.write("\n".join(even_lines) + "\n")
-        with open(out_odd, 'w') as f:
-            f.write("\n".join(odd_lines) + "\n")
+        for parity, suffix in ((0, "_0.txt"), (1, "_1.txt")):
+            new_lines = format_lines_by_direction(
+                cls_list[parity::2], xs[parity::2], ys[parity::2], w_l, h_l)
+            with open(os.path.join(output_dir, base_name + suffix), 'w') as f:
+                f.write("\n".join(new_lines) + "\n" if new_lines else "")
 
         print(f"[✓] 已处理并拆分：{fname}")
 
@@ -108,9 +106,30 @@ gray_label_dir   = "dataset_labels/labels_gray_layer"
 bright_label_dir = "dataset_labels/labels_bright_layer"
 mix_label_dir    = "dataset_parity/labels_mix_all"
 output_label_dir = "dataset_parity/labels_mix_parity"
-
-merge_labels_with_suffix(gray_label_dir, bright_label_dir, mix_label_dir)
-process_and_split_labels(mix_label_dir, output_label_dir)
-
-from tools.modify_w_h import modify_wh_by_direction
-modify_wh_by_direction(output_label_dir, w_l, h_l)
\ No newline at end of file
+output_store_dir = "dataset_parity/label_store/labels_mix_parity"
+
+# 供流水线按文件增量生成：{输出名: ([对应的 gray / bright 源标签文件], 输出 txt)}
+# 每个源标签文件拆成 _0 / _1 两个输出，只依赖该源文件
+def split_items():
+    items = {}
+    for src_dir, suffix in ((gray_label_dir, "_g"), (bright_label_dir, "_b")):
+        for fname in sorted(os.listdir(src_dir)):
+            if not fname.endswith(".txt") or fname == "classes.txt":
+                continue
+            base = os.path.splitext(fname)[0] + suffix
+            for parity in ("_0", "_1"):
+                items[base + parity] = ([os.path.join(src_dir, fname)],
+                                        os.path.join(output_label_dir, base + parity + ".txt"))
+    return items
+
+# only: 只重新生成这些输出（供流水线增量运行使用），None 表示全部
+def main(only=None):
+    merge_labels_with_suffix(gray_label_dir, bright_label_dir, mix_label_dir)
+    sources = None if only is None else {key.rsplit("_", 1)[0] for key in only}
+    process_and_split_labels(mix_label_dir, output_label_dir, sources)
+    # 同时保存二进制标签库，图像合成阶段直接读取，不再解析 txt
+    LabelStore.from_dir(output_label_dir).save(output_store_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
-import shutil
 import argparse
 import cv2
 from collections import defaultdict
 import tools.parameters as pr
+from tools.image_cache import imread_flags
+from tools.materialize import MATERIALIZE_MODES, MaterializeStats
+from tools.yolo_manifest import write_virtual_splits
 import numpy as np
 
 # 固定编号组
@@ -35,7 +37,9 @@ def rotate_image(img, angle):
         return img
 
 # 文件复制主逻辑
-def copy_and_split(image_dir, label_dir, output_image_dir, output_label_dir, background_dir=None):
+def copy_and_split(image_dir, label_dir, output_image_dir, output_label_dir, background_dir=None,
+                   materialize="copy"):
+    place = MaterializeStats(materialize)
     groups = defaultdict(list)
     image_files = [f for f in os.listdir(image_dir) if f.lower().endswith((".jpg", ".jpeg", ".png"))]
 
@@ -63,9 +67,9 @@ def copy_and_split(image_dir, label_dir, output_image_dir, output_label_dir, bac
             label_src_path = os.path.join(label_dir, label_file)
             label_dst_path = os.path.join(output_label_dir, subset, label_file)
 
-            shutil.copy(image_src_path, image_dst_path)
+            place(image_src_path, image_dst_path)
             if os.path.exists(label_src_path):
-                shutil.copy(label_src_path, label_dst_path)
+                place(label_src_path, label_dst_path)
 
     # 背景图处理
     if background_dir:
@@ -81,7 +85,7 @@ def copy_and_split(image_dir, label_dir, output_image_dir, output_label_dir, bac
                 continue
 
             bg_path = os.path.join(background_dir, bg_file)
-            img = cv2.imread(bg_path)
+            img = cv2.imread(bg_path, imread_flags(pr.gray_native))
             if img is None:
                 print(f"⚠️ 读取失败: {bg_path}")
                 continue
@@ -117,24 +121,43 @@ def copy_and_split(image_dir, label_dir, output_image_dir, output_label_dir, bac
     valid_count = sum(len(groups[str(i)]) for i in valid_ids if str(i) in groups)
 
     print("✅ 数据集划分完成！")
+    print(place.summary())
     print(f"Train: {len(train_ids)} groups, {train_count} images")
     print(f"Test: {len(test_ids)} groups, {test_count} images")
     print(f"Valid: {len(valid_ids)} groups, {valid_count} images")
 
 # ========== 主程序入口 ==========
 
-parser = argparse.ArgumentParser(description="按编号划分图像和标签为 train/test/valid，并添加背景图像")
-parser.add_argument('--image_dir', type=str, default="dataset_random/images_mix_random_enh", help='图像源路径')
-parser.add_argument('--label_dir', type=str, default="dataset_random/labels_mix_random", help='标签源路径')
-parser.add_argument('--output_image_dir', type=str, default=pr.YOLO_save_dir_image, help='图像输出路径')
-parser.add_argument('--output_label_dir', type=str, default=pr.YOLO_save_dir_label, help='标签输出路径')
-parser.add_argument('--background_dir', type=str, default="dataset_mod", help='背景图路径')
-args = parser.parse_args()
-
-copy_and_split(
-    args.image_dir,
-    args.label_dir,
-    args.output_image_dir,
-    args.output_label_dir,
-    args.background_dir
-)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按编号划分图像和标签为 train/test/valid，并添加背景图像")
+    parser.add_argument('--image_dir', type=str, default="dataset_random/images_mix_random_enh", help='图像源路径')
+    parser.add_argument('--label_dir', type=str, default="dataset_random/labels_mix_random", help='标签源路径')
+    parser.add_argument('--output_image_dir', type=str, default=pr.YOLO_save_dir_image, help='图像输出路径')
+    parser.add_argument('--output_label_dir', type=str, default=pr.YOLO_save_dir_label, help='标签输出路径')
+    parser.add_argument('--background_dir', type=str, default="dataset_mod", help='背景图路径')
+    parser.add_argument('--materialize', choices=MATERIALIZE_MODES, default="copy",
+                        help='文件放置方式：copy / hardlink / reflink / symlink（不支持时自动退回 copy）/ move（源为临时目录时）')
+    parser.add_argument('--split_mode', choices=['physical', 'manifest'], default='physical',
+                        help='physical: 复制到 train/test/valid 目录；manifest: 只写 YOLO 清单（train.txt/val.txt + data.yaml）')
+    parser.add_argument('--manifest_dir', type=str, default="dataset_random/splits", help='清单输出路径（manifest 模式）')
+    parser.add_argument('--kfold', type=int, default=0, help='manifest 模式下做 k 折交叉验证（test 组保持固定）')
+    parser.add_argument('--seed', type=int, default=0, help='k 折划分随机种子')
+    args = parser.parse_args(argv)
+
+    if args.split_mode == 'manifest':
+        write_virtual_splits(args.image_dir, args.label_dir, args.manifest_dir,
+                             train_ids, test_ids, valid_ids, kfold=args.kfold, seed=args.seed)
+        return
+
+    copy_and_split(
+        args.image_dir,
+        args.label_dir,
+        args.output_image_dir,
+        args.output_label_dir,
+        args.background_dir,
+        materialize=args.materialize
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,88 @@
-import subprocess
+import os
+import argparse
+import tools.parameters as pr
+from tools.pipeline import Stage, run_pipeline
+from tools.image_cache import find_image, SourceImageCache, imread_flags
+from tools.materialize import KEEP_SOURCE_MODES
+from tools.image_synth import iter_synthesized
+from tools.label_store import LabelStore
+from tools.yolo_export import YoloSplitSink
+import random_labels_combine as labels_step
+import random_images_combine as images_step
+import random_data_split as split_step
 
-print("Step 1: 处理 label")
-subprocess.run(["python3", "random_labels_combine.py"])
+parser = argparse.ArgumentParser(description="按需重新生成 random 数据集（只重做输入发生变化的阶段和文件）")
+parser.add_argument('--force', action='store_true', help='忽略清单，全部重新生成')
+parser.add_argument('--workers', type=int, default=1, help='图像合成并行进程数')
+parser.add_argument('--stream', action='store_true',
+                    help='流式模式：标签 → 合成 → 按编号直接写入最终 YOLO 目录，不落中间目录（不含背景图裁剪）')
+parser.add_argument('--materialize', choices=KEEP_SOURCE_MODES, default="copy", help='划分数据集时的文件放置方式')
+args = parser.parse_args()
 
-print("Step 2: 处理 image")
-subprocess.run(["python3", "random_images_combine.py"])
+tools_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tools")
 
-print("Step 3: 划分数据集")
-subprocess.run(["python3", "random_data_split.py"])
\ No newline at end of file
+# 每个合成图像只依赖自己的标签文件、对应的源图和标签库中自己的那段记录
+def image_items():
+    store_dir = labels_step.output_store_dir
+    store = LabelStore.load(store_dir) if os.path.exists(os.path.join(store_dir, "names.npy")) else None
+    items = {}
+    for f in os.listdir(images_step.label_dir):
+        if not f.endswith(".txt"):
+            continue
+        base = os.path.splitext(f)[0]
+        source = find_image(images_step.image_dir, base.split("_")[0])
+        paths = [os.path.join(images_step.label_dir, f)] + ([source] if source else [])
+        digest = (store.digest(base),) if store is not None and base in store else ()
+        items[base] = (paths, os.path.join(images_step.out_dir, base + ".png")) + digest
+    return items
+
+# 标签库存在时直接读取，否则退回解析 txt
+def label_store_args():
+    store_dir = labels_step.output_store_dir
+    return ["--label_store", store_dir] if os.path.exists(os.path.join(store_dir, "names.npy")) else []
+
+stages = [
+    # 按样本增量：每个组合只依赖所属编号的 gray / bright 源标签（per_sample 随机流），
+    # num_combinations 决定条目集合，增减组合数只生成新增的样本、删除多余的样本
+    Stage("处理 label",
+          run=lambda only: labels_step.main([], only=only),
+          output_dir=labels_step.output_label_dir,
+          params={k: getattr(pr, k) for k in
+                  ("gray_count", "bright_count", "min_manhattan_distance", "w_l", "h_l")},
+          code=[labels_step.__file__, os.path.join(tools_dir, "label_sampler.py"),
+                os.path.join(tools_dir, "label_store.py"), os.path.join(tools_dir, "modify_w_h.py")],
+          items=labels_step.sample_items),
+    Stage("处理 image",
+          run=lambda only: images_step.main(["--workers", str(args.workers)] + label_store_args(), only=only),
+          output_dir=images_step.out_dir,
+          inputs=[images_step.patch_root],
+          params={k: getattr(pr, k) for k in
+                  ("w_b", "h_b", "w_g", "h_g", "replacement_left", "replacement_right", "gray_native", "output_bgr")},
+          code=[images_step.__file__, os.path.join(tools_dir, "image_synth.py"),
+                os.path.join(tools_dir, "Img_Enhance.py"), os.path.join(tools_dir, "image_cache.py"),
+                os.path.join(tools_dir, "label_store.py"), os.path.join(tools_dir, "patch_bank.py")],
+          items=image_items),
+    Stage("划分数据集",
+          run=lambda only: split_step.main(["--materialize", args.materialize]),
+          output_dir=pr.YOLO_save_dir_image,
+          outputs=[pr.YOLO_save_dir_label],
+          inputs=[images_step.out_dir, labels_step.output_label_dir, "dataset_mod"],
+          params={"YOLO_save_dir_image": pr.YOLO_save_dir_image, "YOLO_save_dir_label": pr.YOLO_save_dir_label,
+                  "train_ids": split_step.train_ids, "test_ids": split_step.test_ids, "valid_ids": split_step.valid_ids},
+          code=[split_step.__file__]),
+]
+
+# 流式：生成器逐个产出 (样本名, 图像, 标签)，由 sink 按编号写入最终目录
+def run_stream():
+    # 标签组合在内存中直接交给合成，不写 labels_mix_random
+    samples = labels_step.iter_combinations()
+    gray = pr.gray_native
+    cache = SourceImageCache(images_step.image_dir, max_bytes=pr.source_cache_mb * 1024 * 1024,
+                             flags=imread_flags(gray))
+    stream = iter_synthesized(samples, images_step.make_patch_map(gray), cache, output_bgr=pr.output_bgr)
+    YoloSplitSink(pr.YOLO_save_dir_image, pr.YOLO_save_dir_label, split_step.assign_group).consume(stream)
+
+if args.stream:
+    run_stream()
+else:
+    run_pipeline(stages, force=args.force)
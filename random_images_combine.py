@@ -1,16 +1,10 @@
 # %%
-import os
-import cv2
+import argparse
 import tools.parameters as pr
-
-# ⬆️➡️⬇️⬅️ 方向编号函数
-def judge_direction(x, y):
-    dx = x - 0.5
-    dy = y - 0.5
-    if abs(dy) > abs(dx):
-        return 0 if y < 0.5 else 2  # 上 or 下
-    else:
-        return 3 if x < 0.5 else 1  # 左 or 右
+from tools.image_synth import combine_images
+from tools.patch_bank import load_patch_bank
+from tools.image_cache import SourceImageCache, imread_flags
+from tools.label_store import LabelStore
 
 # 目录设置
 image_dir = "dataset_unmod/data_unenh_pruned"
@@ -18,182 +12,45 @@ label_dir = "dataset_random/labels_mix_random"
 
 
 out_dir = "dataset_random/images_mix_random_enh"
+patch_root = "patches_texture"
 tmpdir = "dataset_random/tmp"
 
-in_dir = image_dir
-output_dir = out_dir
-os.makedirs(output_dir, exist_ok=True)
-
-
-replacement_right = pr.replacement_right
-replacement_left = pr.replacement_left
-# patch size setting
-w_b = pr.w_b
-h_b = pr.h_b
-w_g = pr.w_g
-h_g = pr.h_g
-
 # 加载所有方向的 patch（bright & gray）从新目录
-patch_map = {}
-patch_root = "patches_texture"
-for light in ['g']:  # bright, gray
-    for dir_id in range(4):  # 0:上, 1:右, 2:下, 3:左
-        patch_path = os.path.join(patch_root, f"patch_texture_{light}_{dir_id}.png")
-        patch = cv2.imread(patch_path)
-        if patch is None:
-            raise FileNotFoundError(f"找不到 patch 文件: {patch_path}")
-        if dir_id == 0 or dir_id == 2:  # 上下方向
-            patch = cv2.resize(patch, (w_g, h_g))
-        else:  # 左右方向
-            patch = cv2.resize(patch, (h_g, w_g))
-        patch_map[(light, dir_id)] = patch
-
-for dir_id in range(2):  # 0:上, 1:右, 2:下, 3:左
-    light = 'b'
-    if dir_id == 0:  # 上下方向
-        patch = cv2.resize(replacement_left, (w_b, h_b))
-    else:  # 左右方向
-        patch = cv2.resize(replacement_right, (h_b, w_b))
-    patch_map[(light, dir_id)] = patch
-
-
-# 支持图像扩展名
-image_exts = (".png", ".jpg", ".jpeg")
-
-# 处理标签
-label_files = [f for f in os.listdir(label_dir) if f.endswith(".txt")]
-
-cnt = 0
-
-for label_file in label_files:
-    img_id = label_file.split("_")[0]  # 例如 9_14 → 9
-    base = os.path.splitext(label_file)[0]  # 9_14
-    image_path = None
-
-    for ext in image_exts:
-        candidate = os.path.join(image_dir, img_id + ext)
-        if os.path.exists(candidate):
-            image_path = candidate
-            break
-
-    if image_path is None:
-        print(f"[Skip] 未找到图像: {img_id}")
-        continue
-
-    img = cv2.imread(image_path)
-    if img is None:
-        print(f"[Error] 图像读取失败: {image_path}")
-        continue
-
-    h, w = img.shape[:2]
-    label_path = os.path.join(label_dir, label_file)
-    with open(label_path, 'r') as f:
-        lines = f.readlines()
-
-    for line in lines:
-        parts = line.strip().split()
-        if len(parts) < 3:
-            continue
-        cls = int(parts[0])  # 0=bright, 1=gray
-        if cls == 0:
-            continue  # 只处理 gray 标签
-        x, y = float(parts[1]), float(parts[2])
-        cx = int(x * w)
-        cy = int(y * h)
-
-        direction = judge_direction(x, y)
-        light = 'b' if cls == 0 else 'g'
-        patch = patch_map[(light, direction)]
-
-        ph, pw = patch.shape[:2]
-        top = max(0, cy - ph // 2)
-        left = max(0, cx - pw // 2)
-        bottom = min(h, top + ph)
-        right = min(w, left + pw)
-        patch_cropped = patch[:bottom-top, :right-left]
-
-        if (bottom - top) <= 0 or (right - left) <= 0:
-            print(f"[Skip Patch] patch 超出边界: {base}, cx={cx}, cy={cy}, w={w}, h={h}")
-            continue
-
-        img[top:bottom, left:right] = patch_cropped
-
-    # 保存图像
-    save_name = base + ".png"
-    save_path = os.path.join(output_dir, save_name)
-    cv2.imwrite(save_path, img)
-    print(f"[OK] 已保存: {save_name}")
-    # if cnt == 0:
-        # break
-
-from tools.Img_Enhance import Enhance_all
-
-in_dir = out_dir
-output_dir = tmpdir
-
-Enhance_all(in_dir, output_dir)
-image_dir = tmpdir
-output_dir = out_dir
-
-for label_file in label_files:
-    img_id = label_file.split("_")[0]  # 例如 9_14 → 9
-    base = os.path.splitext(label_file)[0]  # 9_14
-    image_path = None
-
-    for ext in image_exts:
-        candidate = os.path.join(image_dir, base + ext)
-        if os.path.exists(candidate):
-            image_path = candidate
-            break
-
-    if image_path is None:
-        print(f"[Skip] 未找到图像: {img_id}")
-        continue
-
-    img = cv2.imread(image_path)
-    if img is None:
-        print(f"[Error] 图像读取失败: {image_path}")
-        continue
-
-    h, w = img.shape[:2]
-    label_path = os.path.join(label_dir, label_file)
-    with open(label_path, 'r') as f:
-        lines = f.readlines()
-
-    for line in lines:
-        parts = line.strip().split()
-        if len(parts) < 3:
-            continue
-        cls = int(parts[0])  # 0=bright, 1=gray
-        if cls == 1:
-            continue  # 只处理 bright 标签
-        x, y = float(parts[1]), float(parts[2])
-        cx = int(x * w)
-        cy = int(y * h)
-
-        direction = 0 if x < 0.5 else 1
-        light = 'b' if cls == 0 else 'g'
-        patch = patch_map[(light, direction)]
-
-        ph, pw = patch.shape[:2]
-        top = max(0, cy - ph // 2)
-        left = max(0, cx - pw // 2)
-        bottom = min(h, top + ph)
-        right = min(w, left + pw)
-        patch_cropped = patch[:bottom-top, :right-left]
-
-        if img.ndim == 2:
-            img[top:bottom, left:right] = patch_cropped
-        else:
-            if patch_cropped.ndim == 2:
-                patch_cropped = cv2.cvtColor(patch_cropped, cv2.COLOR_GRAY2BGR)
-            img[top:bottom, left:right] = patch_cropped
-
-    # 保存图像
-    save_name = base + ".png"
-    save_path = os.path.join(output_dir, save_name)
-    cv2.imwrite(save_path, img)
-    print(f"[OK] 已保存: {save_name}")
-    # if cnt == 0:
-        # break
-# %%
\ No newline at end of file
+def make_patch_map(gray):
+    replacement_right = pr.replacement_right_gray if gray else pr.replacement_right
+    replacement_left = pr.replacement_left_gray if gray else pr.replacement_left
+    # patch size setting
+    w_b = pr.w_b
+    h_b = pr.h_b
+    w_g = pr.w_g
+    h_g = pr.h_g
+    # 缩放好的 patch 缓存在 patch 库中（mmap），参数不变时不再重新解码、缩放
+    sizes = list(dict.fromkeys([(w_b, h_b, w_g, h_g)] + list(pr.patch_sizes)))
+    bank = load_patch_bank(patch_root, sizes, replacement_left, replacement_right, gray=gray,
+                           cache_dir=pr.patch_bank_dir)
+    return bank.patch_map((w_b, h_b, w_g, h_g))
+
+# only: 只重新生成这些样本（供流水线增量运行使用），None 表示全部
+def main(argv=None, only=None):
+    parser = argparse.ArgumentParser(description="按标签在原图上粘贴 patch 并增强")
+    parser.add_argument('--legacy_disk', action='store_true', help='使用旧流程（经 tmp 目录多次读写）')
+    parser.add_argument('--label_store', type=str, default=None,
+                        help='直接读取二进制标签库（如 dataset_random/label_store/labels_mix_random），不解析 txt')
+    parser.add_argument('--workers', type=int, default=1, help='并行进程数（按源图编号分片）')
+    args = parser.parse_args(argv)
+
+    # 旧流程固定使用三通道
+    gray = pr.gray_native and not args.legacy_disk
+    patch_map = make_patch_map(gray)
+
+    labels = LabelStore.load(args.label_store) if args.label_store else label_dir
+
+    # 源图只解码一次，所有标签组合共享
+    cache = SourceImageCache(image_dir, max_bytes=pr.source_cache_mb * 1024 * 1024, flags=imread_flags(gray))
+    return combine_images(image_dir, labels, out_dir, patch_map, tmpdir=tmpdir, legacy=args.legacy_disk, cache=cache,
+                          output_bgr=pr.output_bgr, workers=args.workers, only=only)
+
+
+if __name__ == "__main__":
+    main()
+# %%
@@ -1,94 +1,178 @@
 import os
 import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from tqdm import tqdm
 import tools.parameters as pr
+from tools.label_store import LabelStore, load_label_store
+from tools.modify_w_h import apply_wh_by_direction
+from tools.label_sampler import CombinationSampler, sample_rng
 
 
-random.seed(42)
 # 输入文件夹路径
 gray_label_dir = "dataset_labels/labels_gray_all"
 bright_label_dir = "dataset_labels/labels_bright_all"
 
 # 输出文件夹路径
 output_label_dir = "dataset_random/labels_mix_random"
-os.makedirs(output_label_dir, exist_ok=True)
-
-# 抽样参数
-num_combinations = pr.num_combinations
-gray_count = pr.gray_count
-bright_count = pr.bright_count
-min_manhattan_distance = pr.min_manhattan_distance
-
-# ----------- 工具函数 -----------
-
-# 替换 gray 的 class 为 1（防止混合后无法区分来源）
-def read_gray_lines(filepath):
-    with open(filepath, 'r') as f:
-        lines = [line.strip().split() for line in f if line.strip()]
-    for line in lines:
-        line[0] = '1'
-    return lines
-
-# 读取 bright 标签，保持原样（class 0）
-def read_bright_lines(filepath):
-    with open(filepath, 'r') as f:
-        return [line.strip().split() for line in f if line.strip()]
-
-# 判断组合中任意两个框之间是否都满足最小曼哈顿距离
-def check_min_manhattan(labels, min_dist):
-    for i in range(len(labels)):
-        xi, yi = float(labels[i][1]), float(labels[i][2])
-        for j in range(i + 1, len(labels)):
-            xj, yj = float(labels[j][1]), float(labels[j][2])
-            dist = abs(xi - xj) + abs(yi - yj)
-            if dist < min_dist:
-                return False
-    return True
-
-# 从 gray 和 bright 中抽样组合，直到满足最小距离要求
-def sample_valid_combination(gray_labels, bright_labels, gray_k, bright_k, min_dist, max_attempts=50000):
-    for _ in range(max_attempts):
-        gray_sample = random.sample(gray_labels, gray_k)
-        bright_sample = random.sample(bright_labels, bright_k)
-        merged = gray_sample + bright_sample
-        if check_min_manhattan(merged, min_dist):
-            return merged
-    return None
-
-# ----------- 主执行流程 -----------
+store_root = "dataset_random/label_store"
+output_store_dir = os.path.join(store_root, "labels_mix_random")
+
+
+# 二进制标签库：源标签解析一次后缓存
+def load_stores():
+    gray_store = load_label_store(gray_label_dir, os.path.join(store_root, "gray_all"))
+    bright_store = load_label_store(bright_label_dir, os.path.join(store_root, "bright_all"))
+    return gray_store, bright_store
 
 # 获取共有的标签文件（按名称交集）
-gray_label_files = set(f for f in os.listdir(gray_label_dir) if f.endswith(".txt"))
-bright_label_files = set(f for f in os.listdir(bright_label_dir) if f.endswith(".txt"))
-common_files = sorted(list(gray_label_files & bright_label_files))
-
-# 主循环处理每个图像对应的标签文件
-for file in common_files:
-    gray_path = os.path.join(gray_label_dir, file)
-    bright_path = os.path.join(bright_label_dir, file)
-
-    gray_lines = read_gray_lines(gray_path)
-    bright_lines = read_bright_lines(bright_path)
-
-    if len(gray_lines) < gray_count or len(bright_lines) < bright_count:
-        print(f"[Skip] 标签不足: {file}")
-        continue
-
-    for i in range(num_combinations):
-        sample = sample_valid_combination(
-            gray_lines, bright_lines, gray_count, bright_count, min_manhattan_distance
-        )
+def common_names(gray_store, bright_store):
+    return sorted(set(gray_store.names) & set(bright_store.names), key=lambda n: n + ".txt")
+
+# 全部样本名（按编号、序号排序）及其所属源标签文件；标签不足的编号不产出样本
+def sample_sources(gray_store, bright_store):
+    sources = {}
+    for name in common_names(gray_store, bright_store):
+        if len(gray_store[name]) < pr.gray_count or len(bright_store[name]) < pr.bright_count:
+            continue
+        files = [os.path.join(gray_label_dir, name + ".txt"), os.path.join(bright_label_dir, name + ".txt")]
+        for i in range(pr.num_combinations):
+            sources[f"{name}_{i}"] = files
+    return sources
+
+# 供流水线按样本增量生成：{样本名: (所属的 gray / bright 源标签文件, 输出 txt)}
+# per_sample 随机流下每个样本只取决于 (seed, 编号, 序号) 和这两个源文件
+def sample_items():
+    return {key: (files, os.path.join(output_label_dir, key + ".txt"))
+            for key, files in sample_sources(*load_stores()).items()}
+
+# 单个图像的全部组合：返回 ([(样本名, 标签记录), ...], [提示信息, ...])
+# rng 仅 sequential 模式使用；per_sample 模式下结果只取决于 (seed, 编号, 序号)
+def combine_one(gray_store, bright_store, name, sampler="numpy", seed=42, rng_mode="per_sample", rng=None,
+                only=None):
+    file = name + ".txt"
+    indices = [i for i in range(pr.num_combinations) if only is None or f"{name}_{i}" in only]
+    if not indices:
+        return [], []
+    pool = CombinationSampler(gray_store[name], bright_store[name], pr.gray_count, pr.bright_count,
+                              pr.min_manhattan_distance, sampler)
+    if not pool.enough_labels():
+        return [], [f"[Skip] 标签不足: {file}"]
+
+    samples, messages = [], []
+    for i in indices:
+        sample = pool.sample(sample_rng(seed, name, i) if rng_mode == "per_sample" else rng)
         if sample is None:
-            print(f"[Warn] 找不到合法组合: {file}, 第 {i+1} 组")
+            messages.append(f"[Warn] 找不到合法组合: {file}, 第 {i+1} 组")
             continue
-
-        out_file = os.path.join(output_label_dir, f"{os.path.splitext(file)[0]}_{i}.txt")
-        with open(out_file, 'w') as f:
-            for item in sample:
-                f.write(" ".join(item) + "\n")
-        print(f"[OK] 写入完成: {out_file}")
-
-from tools.modify_w_h import modify_wh_by_direction
-import tools.parameters as pr
-w_l = pr.w_l
-h_l = pr.h_l
-modify_wh_by_direction(output_label_dir, w_l, h_l)
\ No newline at end of file
+        # 按方向设定 w/h 后再产出，每个标签文件只写一次
+        samples.append((f"{name}_{i}", apply_wh_by_direction(sample, pr.w_l, pr.h_l)))
+    return samples, messages
+
+# 逐个产出 (样本名, 标签记录)；既可汇总写盘，也可直接交给流式流水线
+# rng_mode: per_sample 时每个 (编号, 序号) 各用独立随机流（sample_rng），任意子集可单独重新生成；
+#           sequential 为旧方式，整个运行共用一个随机流（可复现之前生成的数据集）
+# only: 只产出这些样本名（如 {"9_14"}），None 表示全部；仅 per_sample 时与完整运行的结果一致
+def iter_combinations(sampler="numpy", seed=42, rng_mode="per_sample", only=None):
+    random.seed(seed)
+    rng = np.random.default_rng(seed)
+    gray_store, bright_store = load_stores()
+
+    for name in common_names(gray_store, bright_store):
+        samples, messages = combine_one(gray_store, bright_store, name, sampler, seed, rng_mode, rng, only)
+        for message in messages:
+            print(message)
+        yield from samples
+        if samples:
+            print(f"[OK] 组合完成: {name}.txt")
+
+
+# ---------- 多进程：按源文件分发，每个样本独立随机流 ----------
+_worker = {}
+
+def _init_worker(sampler, seed):
+    _worker.update(stores=load_stores(), sampler=sampler, seed=seed)
+
+def _combine_task(name, only):
+    gray_store, bright_store = _worker["stores"]
+    return combine_one(gray_store, bright_store, name, _worker["sampler"], _worker["seed"], only=only)
+
+def combine_all(sampler="numpy", seed=42, rng_mode="per_sample", workers=1, only=None):
+    """生成全部组合（only 给定时只生成这些样本），返回 {样本名: 标签记录}（按编号、序号排序）；
+    只显示一个进度条，提示信息最后统一输出。"""
+    gray_store, bright_store = load_stores()
+    names = common_names(gray_store, bright_store)
+    results = {}
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(sampler, seed)) as ex:
+            futures = {ex.submit(_combine_task, name, only): name for name in names}
+            for fut in tqdm(as_completed(futures), total=len(futures), desc="Combine"):
+                results[futures[fut]] = fut.result()
+    else:
+        random.seed(seed)
+        rng = np.random.default_rng(seed)
+        for name in tqdm(names, desc="Combine"):
+            results[name] = combine_one(gray_store, bright_store, name, sampler, seed, rng_mode, rng, only)
+
+    combined = {}
+    for name in names:
+        samples, messages = results[name]
+        for message in messages:
+            print(message)
+        combined.update(samples)
+    return combined
+
+
+# 增量生成后的完整标签集：only 中的样本用新结果，其余沿用已有标签库中的记录
+def merge_with_store(updated):
+    old = None
+    if os.path.exists(os.path.join(output_store_dir, "names.npy")):
+        old = LabelStore.load(output_store_dir, mmap=False)
+    merged = {}
+    for key in sample_sources(*load_stores()):
+        if key in updated:
+            merged[key] = updated[key]
+        elif old is not None and key in old:
+            merged[key] = old[key]
+    return merged
+
+# only: 只重新生成这些样本（供流水线增量运行使用，需 per_sample 随机流），None 表示全部
+def main(argv=None, only=None):
+    parser = argparse.ArgumentParser(description="从 gray / bright 标签中随机抽取满足最小距离的组合")
+    parser.add_argument('--sampler', choices=['numpy', 'constructive', 'legacy'], default='numpy',
+                        help='numpy: 向量化批量拒绝采样；constructive: 网格索引 + 回溯逐点构造'
+                             '（数量或距离较大时使用，非均匀分布）；legacy: 原纯 Python 采样（random.seed 可复现旧输出）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--rng_mode', choices=['per_sample', 'sequential'], default='per_sample',
+                        help='per_sample: 每个样本独立随机流（可任意顺序、部分、并行生成）；'
+                             'sequential: 旧的单一随机流（复现之前的数据集）。legacy 采样固定使用 random.seed 全局流')
+    parser.add_argument('--workers', type=int, default=1, help='并行进程数（按源标签文件分发，需 per_sample 随机流）')
+    args = parser.parse_args(argv)
+    if args.workers > 1 and (args.rng_mode != 'per_sample' or args.sampler == 'legacy'):
+        parser.error("--workers > 1 需要 --rng_mode per_sample 且不能使用 legacy 采样（单一随机流依赖生成顺序）")
+    if only is not None and (args.rng_mode != 'per_sample' or args.sampler == 'legacy'):
+        raise ValueError("按样本增量生成需要 per_sample 随机流，且不能使用 legacy 采样")
+    if only is not None and not os.path.exists(os.path.join(output_store_dir, "names.npy")):
+        only = None  # 没有可沿用的标签库，完整生成一次
+
+    os.makedirs(output_label_dir, exist_ok=True)
+
+    # 组合结果先写入二进制标签库，最后由主进程一次性导出 txt
+    combined = combine_all(args.sampler, args.seed, args.rng_mode, args.workers, only)
+    if only is None:
+        store = LabelStore.from_dict(combined)
+        store.save(output_store_dir)
+        store.export_yolo(output_label_dir)
+        print(f"[OK] 写入完成: {len(store)} 个标签文件 → {output_label_dir}")
+        return
+
+    # 增量：只导出重新生成的 txt，标签库整体重写（与完整运行得到的库相同）
+    LabelStore.from_dict(merge_with_store(combined)).save(output_store_dir)
+    LabelStore.from_dict(combined).export_yolo(output_label_dir)
+    print(f"[OK] 写入完成: 重新生成 {len(combined)} 个标签文件 → {output_label_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,12 @@
 import cv2
 import numpy as np
 import os
+import json
+import time
+import hashlib
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
 
 # %% 图像增强函数定义
 def Gamma(image, gamma):
@@ -19,39 +24,206 @@ def Sigmoid(image):
     image_sigmoid = 1 / (1 + np.exp(-x)) * 128 + 128
     return np.clip(image_sigmoid, 0, 255).astype('uint8')
 
+# Sigmoid 与 Gamma 都是 uint8 → uint8 的逐像素映射，预先合成一张 256 项查找表；
+# 表本身用原函数对 0..255 计算，结果与逐步计算逐位一致
+_enhance_luts = {}
+
+def Enhance_LUT(gamma=1.5):
+    lut = _enhance_luts.get(gamma)
+    if lut is None:
+        lut = Gamma(Sigmoid(np.arange(256, dtype=np.uint8)), gamma)
+        _enhance_luts[gamma] = lut
+    return lut
+
+# CLAHE 对象每个进程只创建一次（多进程时每个 worker 各一个）
+_clahe = None
+
 def CLAHE_Enh(image):
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    return clahe.apply(image)
+    global _clahe
+    if _clahe is None:
+        _clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    return _clahe.apply(image)
 
 def Enhance(image):
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return Histogram(cv2.LUT(gray, Enhance_LUT(1.5)))
+
+# cv2.equalizeHist 的查找表：与 OpenCV 实现逐位一致（float32 比例、四舍六入五成双）
+def equalize_lut(hist):
+    hist = np.asarray(hist, dtype=np.int64)
+    nonzero = np.flatnonzero(hist)
+    lut = np.zeros(256, dtype=np.uint8)
+    if len(nonzero) == 0:
+        return lut
+    i = nonzero[0]
+    total = int(hist.sum())
+    if hist[i] == total:
+        lut[:] = i
+        return lut
+    scale = np.float32(255.0) / np.float32(total - hist[i])
+    cumsum = np.cumsum(hist[i + 1:])
+    lut[i + 1:] = np.clip(np.rint(cumsum.astype(np.float32) * scale), 0, 255).astype(np.uint8)
+    return lut
+
+# 已知灰度图直方图时的 Enhance：Sigmoid + Gamma + 直方图均衡化合成一张查找表，只做一次 LUT
+# hist 为 gray（增强前）的 256 项直方图，可由源图直方图增量更新得到（见 update_histogram）
+def Enhance_with_hist(gray, hist, gamma=1.5):
+    lut = Enhance_LUT(gamma)
+    enhanced_hist = np.bincount(lut, weights=hist, minlength=256).astype(np.int64)
+    return cv2.LUT(gray, equalize_lut(enhanced_hist)[lut])
+
+# 源图直方图 → 改写若干矩形后的直方图，只统计矩形内的像素（重叠部分只算一次）
+# rects: [(top, bottom, left, right), ...]，before / after 为改写前后的单通道图
+def update_histogram(hist, before, after, rects):
+    if not rects:
+        return hist
+    w = before.shape[1]
+    idx = np.unique(np.concatenate([
+        (np.arange(top, bottom)[:, None] * w + np.arange(left, right)).ravel()
+        for top, bottom, left, right in rects]))
+    return (hist - np.bincount(before.ravel()[idx], minlength=256)
+            + np.bincount(after.ravel()[idx], minlength=256))
+
+# 逐步计算的原实现（float 中间结果），用于核对和基准测试
+def Enhance_reference(image):
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     return Histogram(Gamma(Sigmoid(gray), 1.5))
 
 # %% 批量增强函数
-def Enhance_all(input_folder, output_folder):
+# 输出目录下记录已完成文件的输入校验和，用于 --checksum 续跑
+RESUME_MANIFEST = ".enhance_manifest.json"
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _is_image(filename):
+    return filename.endswith(".png") and not filename.endswith(".part.png")
+
+# 列出待处理的 .png（相对路径），recursive 时包含子目录
+def list_images(input_folder, recursive=False):
+    if not recursive:
+        return sorted(f for f in os.listdir(input_folder) if _is_image(f))
+    files = []
+    for root, dirs, names in os.walk(input_folder):
+        dirs.sort()
+        rel_root = os.path.relpath(root, input_folder)
+        for f in sorted(names):
+            if _is_image(f):
+                files.append(os.path.normpath(os.path.join(rel_root, f)))
+    return files
+
+# 增强单个文件；先写临时文件再改名，中途中断不会留下不完整的输出
+def enhance_file(input_path, output_path, checksum=False):
+    nbytes = os.path.getsize(input_path)
+    digest = file_digest(input_path) if checksum else None
+    image = cv2.imread(input_path)
+    if image is None:
+        raise IOError("无法读取图像")
+    enhanced_final = CLAHE_Enh(Enhance(image))
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(output_path), "." + os.path.basename(output_path) + ".part.png")
+    if not cv2.imwrite(tmp_path, enhanced_final):
+        raise IOError("写入失败")
+    os.replace(tmp_path, output_path)
+    return nbytes, digest
+
+def _enhance_task(input_path, output_path, checksum):
+    try:
+        return enhance_file(input_path, output_path, checksum) + (None,)
+    except Exception as e:
+        return 0, None, str(e)
+
+def _load_resume(output_folder):
+    path = os.path.join(output_folder, RESUME_MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _save_resume(output_folder, done):
+    path = os.path.join(output_folder, RESUME_MANIFEST)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(done, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+def Enhance_all(input_folder, output_folder, workers=1, skip_existing=False, checksum=False, recursive=False):
+    """批量增强 input_folder 下的 .png，结果写入 output_folder（保持相对路径），返回汇总信息。
+
+    skip_existing: 输出已存在的文件跳过；同时指定 checksum 时还要求输入的 sha256
+                   与上次记录一致，输入有变化的文件会重新增强。
+    checksum     : 记录每个已完成文件的输入校验和（output_folder/.enhance_manifest.json），
+                   定期落盘，崩溃后可据此续跑。
+    """
     os.makedirs(output_folder, exist_ok=True)
+    t0 = time.time()
+    files = list_images(input_folder, recursive)
+    done = _load_resume(output_folder) if checksum else {}
+
+    todo, skipped = [], 0
+    for rel in files:
+        input_path = os.path.join(input_folder, rel)
+        output_path = os.path.join(output_folder, rel)
+        if skip_existing and os.path.exists(output_path):
+            if not checksum or done.get(rel) == file_digest(input_path):
+                skipped += 1
+                continue
+        todo.append((rel, input_path, output_path))
+
+    failures, total_bytes, processed = [], 0, 0
+
+    def record(rel, nbytes, digest, error):
+        nonlocal total_bytes, processed
+        if error is not None:
+            failures.append((rel, error))
+            return
+        processed += 1
+        total_bytes += nbytes
+        if checksum:
+            done[rel] = digest
+            if processed % 100 == 0:
+                _save_resume(output_folder, done)
+
+    if workers > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futures = {ex.submit(_enhance_task, i, o, checksum): rel for rel, i, o in todo}
+            for fut in tqdm(as_completed(futures), total=len(futures), desc="Enhance"):
+                record(futures[fut], *fut.result())
+    else:
+        for rel, input_path, output_path in tqdm(todo, desc="Enhance"):
+            record(rel, *_enhance_task(input_path, output_path, checksum))
 
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".png"):
-            input_path = os.path.join(input_folder, filename)
-            output_path = os.path.join(output_folder, filename)
+    if checksum:
+        _save_resume(output_folder, done)
 
-            try:
-                image = cv2.imread(input_path)
-                enhanced = Enhance(image)
-                enhanced_final = CLAHE_Enh(enhanced)
-                cv2.imwrite(output_path, enhanced_final)
-                print(f"✅ 处理完成: {filename}")
-            except Exception as e:
-                print(f"❌ 处理失败: {filename}，错误: {e}")
+    elapsed = max(time.time() - t0, 1e-9)
+    summary = {"total": len(files), "processed": processed, "skipped": skipped, "failed": len(failures),
+               "seconds": elapsed, "images_per_s": processed / elapsed,
+               "mb_per_s": total_bytes / elapsed / (1024 * 1024), "failures": failures}
+    print(f"[Summary] 共 {len(files)} 张：增强 {processed}，跳过 {skipped}，失败 {len(failures)}；"
+          f"用时 {elapsed:.1f}s，{summary['images_per_s']:.2f} 张/s，{summary['mb_per_s']:.2f} MB/s")
+    for rel, error in failures:
+        print(f"❌ 处理失败: {rel}，错误: {error}")
+    return summary
 
 # %% 主入口，加上 argparse 支持
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="批量图像增强脚本")
     parser.add_argument("--input_folder", type=str, required=True, help="输入图像文件夹路径")
     parser.add_argument("--output_folder", type=str, required=True, help="增强图像输出路径")
+    parser.add_argument("--workers", type=int, default=1, help="并行进程数")
+    parser.add_argument("--skip_existing", action="store_true", help="跳过输出已存在的文件（断点续跑）")
+    parser.add_argument("--checksum", action="store_true",
+                        help="记录输入校验和；与 --skip_existing 同用时输入变化的文件会重新增强")
+    parser.add_argument("--recursive", action="store_true", help="递归处理子目录，输出保持相同的目录结构")
     args = parser.parse_args()
 
-    Enhance_all(args.input_folder, args.output_folder)
+    summary = Enhance_all(args.input_folder, args.output_folder, workers=args.workers,
+                          skip_existing=args.skip_existing, checksum=args.checksum, recursive=args.recursive)
+    if summary["failed"]:
+        raise SystemExit(1)
 
-#python Img_Enhance.py --input_folder dataset_mixed/images_mix_random --output_folder dataset_mixed/images_mix_random_enh
+#python Img_Enhance.py --input_folder dataset_mixed/images_mix_random --output_folder dataset_mixed/images_mix_random_enh --workers 8 --skip_existing
@@ -0,0 +1,110 @@
+import os
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+# 支持图像扩展名
+image_exts = (".png", ".jpg", ".jpeg")
+
+# 在目录中按扩展名查找图像
+def find_image(image_dir, name):
+    for ext in image_exts:
+        candidate = os.path.join(image_dir, name + ext)
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+# 源图缓存的默认内存上限
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# 只读 PNG 文件头（IHDR）得到 (h, w)，不解码像素；不是 PNG 时返回 None
+def png_size(path):
+    with open(path, 'rb') as f:
+        head = f.read(24)
+    if len(head) < 24 or head[:8] != PNG_SIGNATURE or head[12:16] != b"IHDR":
+        return None
+    return int.from_bytes(head[20:24], "big"), int.from_bytes(head[16:20], "big")
+
+# 按通道模式选择解码方式（灰度原生 / 三通道 BGR）
+def imread_flags(gray_native):
+    return cv2.IMREAD_GRAYSCALE if gray_native else cv2.IMREAD_COLOR
+
+class SourceImageCache:
+    """按图像编号缓存解码后的源图，LRU 淘汰，总内存不超过 max_bytes。
+
+    缓存键为 (编号, 文件 mtime)，源文件被改写后会自动重新解码。
+    get() 返回只读的共享数组；需要修改时用 checkout() 取一份私有副本，
+    一次内存拷贝远比重新解码 PNG 便宜。
+    """
+
+    def __init__(self, image_dir, max_bytes=DEFAULT_CACHE_BYTES, flags=cv2.IMREAD_COLOR):
+        self.image_dir = image_dir
+        self.max_bytes = max_bytes
+        self.flags = flags
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # img_id -> (path, mtime, array)
+        self._hists = {}  # img_id -> (array, 256 项直方图)
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            img_id, (_, _, arr) = self._entries.popitem(last=False)
+            self._hists.pop(img_id, None)
+            self.nbytes -= arr.nbytes
+
+    def get(self, img_id):
+        entry = self._entries.get(img_id)
+        if entry is not None:
+            path, mtime, arr = entry
+            try:
+                if os.stat(path).st_mtime_ns == mtime:
+                    self._entries.move_to_end(img_id)
+                    self.hits += 1
+                    return arr
+            except OSError:
+                pass
+            del self._entries[img_id]
+            self._hists.pop(img_id, None)
+            self.nbytes -= arr.nbytes
+
+        self.misses += 1
+        path = find_image(self.image_dir, img_id)
+        if path is None:
+            return None
+        mtime = os.stat(path).st_mtime_ns
+        arr = cv2.imread(path, self.flags)
+        if arr is None:
+            return None
+        arr.flags.writeable = False
+        self._entries[img_id] = (path, mtime, arr)
+        self.nbytes += arr.nbytes
+        self._evict()
+        return arr
+
+    def checkout(self, img_id):
+        arr = self.get(img_id)
+        return None if arr is None else arr.copy()
+
+    def source_histogram(self, img_id):
+        """已缓存的单通道源图及其 256 项直方图 (array, hist)，每张源图只统计一次；
+        未缓存或为三通道时返回 None。用于合成时的增量直方图均衡化。"""
+        entry = self._entries.get(img_id)
+        if entry is None or entry[2].ndim != 2:
+            return None
+        arr = entry[2]
+        cached = self._hists.get(img_id)
+        if cached is None or cached[0] is not arr:
+            cached = (arr, np.bincount(arr.ravel(), minlength=256))
+            self._hists[img_id] = cached
+        return cached
+
+    def path(self, img_id):
+        entry = self._entries.get(img_id)
+        return entry[0] if entry is not None else find_image(self.image_dir, img_id)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
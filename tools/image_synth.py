@@ -0,0 +1,340 @@
+# %%
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+from tqdm import tqdm
+from tools.Img_Enhance import Enhance, CLAHE_Enh, Enhance_all, Enhance_with_hist, update_histogram
+from tools.image_cache import SourceImageCache, DEFAULT_CACHE_BYTES, find_image, imread_flags
+from tools.label_store import LabelStore
+
+# ⬆️➡️⬇️⬅️ 方向编号函数
+def judge_direction(x, y):
+    dx = x - 0.5
+    dy = y - 0.5
+    if abs(dy) > abs(dx):
+        return 0 if y < 0.5 else 2  # 上 or 下
+    else:
+        return 3 if x < 0.5 else 1  # 左 or 右
+
+# 加载所有方向的 patch（bright & gray）
+# gray=True 时 patch 为单通道：先按 BGR 缩放再转灰度，与三通道流程中 Enhance 的转换结果一致
+def load_patch_map(patch_root, w_b, h_b, w_g, h_g, replacement_left, replacement_right, gray=False):
+    patch_map = {}
+    for light in ['g']:  # bright, gray
+        for dir_id in range(4):  # 0:上, 1:右, 2:下, 3:左
+            patch_path = os.path.join(patch_root, f"patch_texture_{light}_{dir_id}.png")
+            patch = cv2.imread(patch_path)
+            if patch is None:
+                raise FileNotFoundError(f"找不到 patch 文件: {patch_path}")
+            if dir_id == 0 or dir_id == 2:  # 上下方向
+                patch = cv2.resize(patch, (w_g, h_g))
+            else:  # 左右方向
+                patch = cv2.resize(patch, (h_g, w_g))
+            if gray:
+                patch = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)
+            patch_map[(light, dir_id)] = patch
+
+    for dir_id in range(2):  # 0:左半边, 1:右半边
+        light = 'b'
+        if dir_id == 0:
+            patch = cv2.resize(replacement_left, (w_b, h_b))
+        else:
+            patch = cv2.resize(replacement_right, (h_b, w_b))
+        if gray and patch.ndim == 3:
+            patch = patch[..., 0].copy()
+        patch_map[(light, dir_id)] = patch
+    return patch_map
+
+# 标签文件按图像编号分组排序，保证同一源图的样本连续处理（缓存命中率接近 100%）
+def sort_label_files(label_files):
+    def key(f):
+        img_id = f.split("_")[0]
+        return (int(img_id) if img_id.isdigit() else float("inf"), img_id, f)
+    return sorted(label_files, key=key)
+
+# 按图像编号分组，每组交给一个 worker，源图在组内只解码一次
+def group_label_files(label_files):
+    groups = OrderedDict()
+    for f in sort_label_files(label_files):
+        groups.setdefault(f.split("_")[0], []).append(f)
+    return groups
+
+# 读取标签行（保持字符串，交给各粘贴函数解析）
+def read_label_lines(label_path):
+    with open(label_path, 'r') as f:
+        return [line.strip().split() for line in f.readlines()]
+
+# 标签来源可以是 txt 目录，也可以是 LabelStore（记录元组与文本行的字段顺序相同）
+def list_label_files(labels):
+    if isinstance(labels, LabelStore):
+        return [name + ".txt" for name in labels.names]
+    return [f for f in os.listdir(labels) if f.endswith(".txt")]
+
+def load_label_lines(labels, label_file):
+    if isinstance(labels, LabelStore):
+        return labels[os.path.splitext(label_file)[0]].tolist()
+    return read_label_lines(os.path.join(labels, label_file))
+
+# 粘贴 gray patch（按四个方向选择 patch）
+# rects: 给定列表时追加每个粘贴区域 (top, bottom, left, right)，供增量直方图使用
+def paste_gray_patches(img, lines, patch_map, base="", rects=None):
+    h, w = img.shape[:2]
+    for parts in lines:
+        if len(parts) < 3:
+            continue
+        cls = int(parts[0])  # 0=bright, 1=gray
+        if cls == 0:
+            continue  # 只处理 gray 标签
+        x, y = float(parts[1]), float(parts[2])
+        cx = int(x * w)
+        cy = int(y * h)
+
+        direction = judge_direction(x, y)
+        patch = patch_map[('g', direction)]
+
+        ph, pw = patch.shape[:2]
+        top = max(0, cy - ph // 2)
+        left = max(0, cx - pw // 2)
+        bottom = min(h, top + ph)
+        right = min(w, left + pw)
+        patch_cropped = patch[:bottom-top, :right-left]
+
+        if (bottom - top) <= 0 or (right - left) <= 0:
+            print(f"[Skip Patch] patch 超出边界: {base}, cx={cx}, cy={cy}, w={w}, h={h}")
+            continue
+
+        img[top:bottom, left:right] = patch_cropped
+        if rects is not None:
+            rects.append((top, bottom, left, right))
+    return img
+
+# 粘贴 bright patch（按左右半边选择 patch）
+def paste_bright_patches(img, lines, patch_map):
+    h, w = img.shape[:2]
+    for parts in lines:
+        if len(parts) < 3:
+            continue
+        cls = int(parts[0])  # 0=bright, 1=gray
+        if cls == 1:
+            continue  # 只处理 bright 标签
+        x, y = float(parts[1]), float(parts[2])
+        cx = int(x * w)
+        cy = int(y * h)
+
+        direction = 0 if x < 0.5 else 1
+        patch = patch_map[('b', direction)]
+
+        ph, pw = patch.shape[:2]
+        top = max(0, cy - ph // 2)
+        left = max(0, cx - pw // 2)
+        bottom = min(h, top + ph)
+        right = min(w, left + pw)
+        patch_cropped = patch[:bottom-top, :right-left]
+
+        if img.ndim == 2:
+            img[top:bottom, left:right] = patch_cropped
+        else:
+            if patch_cropped.ndim == 2:
+                patch_cropped = cv2.cvtColor(patch_cropped, cv2.COLOR_GRAY2BGR)
+            img[top:bottom, left:right] = patch_cropped
+    return img
+
+# 单张图像的完整合成：gray patch → 增强 → bright patch，全程在内存中完成
+# 单通道输入时全程保持 H×W，只有 output_bgr=True 时才在最后扩成三通道
+# source: 可选的 (源图, 源图直方图)（SourceImageCache.source_histogram），img 为其副本时
+# 只按 gray patch 区域增量更新直方图，均衡化不再扫描整张图；结果与 Enhance 逐位一致
+def synthesize_image(img, lines, patch_map, base="", output_bgr=True, source=None):
+    if source is not None and img.ndim == 2:
+        rects = []
+        paste_gray_patches(img, lines, patch_map, base, rects)
+        src, src_hist = source
+        enhanced = CLAHE_Enh(Enhance_with_hist(img, update_histogram(src_hist, src, img, rects)))
+    else:
+        paste_gray_patches(img, lines, patch_map, base)
+        enhanced = CLAHE_Enh(Enhance(img))
+    if img.ndim == 2:
+        paste_bright_patches(enhanced, lines, patch_map)
+        return cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR) if output_bgr else enhanced
+    # 与旧流程中 imread 读回灰度 PNG 的结果一致（三通道复制）
+    img = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)
+    return paste_bright_patches(img, lines, patch_map)
+
+# 批量合成：每个样本只解码源图一次、编码输出一次；label_dir 可为 txt 目录或 LabelStore
+def combine_images(image_dir, label_dir, output_dir, patch_map, tmpdir=None, legacy=False, cache=None,
+                   gray=False, output_bgr=True, workers=1, only=None):
+    os.makedirs(output_dir, exist_ok=True)
+    label_files = sort_label_files(list_label_files(label_dir))
+    if only is not None:
+        label_files = [f for f in label_files if os.path.splitext(f)[0] in only]
+
+    if legacy:
+        return combine_images_legacy(image_dir, label_dir, output_dir, tmpdir, patch_map, label_files)
+    if workers > 1:
+        flags = cache.flags if cache is not None else imread_flags(gray)
+        max_bytes = cache.max_bytes if cache is not None else DEFAULT_CACHE_BYTES
+        return combine_images_parallel(image_dir, label_dir, output_dir, patch_map, label_files,
+                                       flags, output_bgr, workers, max_bytes)
+
+    if cache is None:
+        cache = SourceImageCache(image_dir, flags=imread_flags(gray))
+
+    failures = []
+    for label_file in label_files:
+        img_id = label_file.split("_")[0]  # 例如 9_14 → 9
+        base = os.path.splitext(label_file)[0]  # 9_14
+
+        image_path = cache.path(img_id)
+        if image_path is None:
+            print(f"[Skip] 未找到图像: {img_id}")
+            failures.append((base, "未找到图像"))
+            continue
+
+        img = cache.checkout(img_id)
+        if img is None:
+            print(f"[Error] 图像读取失败: {image_path}")
+            failures.append((base, "图像读取失败"))
+            continue
+
+        lines = load_label_lines(label_dir, label_file)
+        try:
+            img = synthesize_image(img, lines, patch_map, base, output_bgr, cache.source_histogram(img_id))
+        except Exception as e:
+            print(f"❌ 处理失败: {base}，错误: {e}")
+            failures.append((base, str(e)))
+            continue
+
+        # 保存图像
+        save_name = base + ".png"
+        cv2.imwrite(os.path.join(output_dir, save_name), img)
+        print(f"[OK] 已保存: {save_name}")
+
+    print(f"[Cache] 源图缓存命中率: {cache.hit_rate():.1%}（解码 {cache.misses} 次）")
+    return failures
+
+# ---------- 流式 ----------
+
+# 把标签目录 / LabelStore 转成 (样本名, 标签行) 流，按编号分组排序
+def iter_label_files(labels):
+    for label_file in sort_label_files(list_label_files(labels)):
+        yield os.path.splitext(label_file)[0], load_label_lines(labels, label_file)
+
+def iter_synthesized(samples, patch_map, cache, output_bgr=True):
+    """流式合成：输入 (样本名, 标签) 流，产出 (样本名, 图像数组, 标签)，不写任何中间文件。
+
+    标签可以是文本行的拆分结果，也可以是 LabelStore 的记录数组。
+    """
+    for base, labels in samples:
+        img_id = base.split("_")[0]
+        img = cache.checkout(img_id)
+        if img is None:
+            print(f"[Skip] 未找到或无法读取图像: {img_id}")
+            continue
+        lines = labels.tolist() if hasattr(labels, "dtype") else labels
+        try:
+            img = synthesize_image(img, lines, patch_map, base, output_bgr, cache.source_histogram(img_id))
+        except Exception as e:
+            print(f"❌ 处理失败: {base}，错误: {e}")
+            continue
+        yield base, img, labels
+
+# ---------- 多进程 ----------
+_worker = {}
+
+def _init_worker(image_dir, label_dir, output_dir, patch_map, flags, output_bgr, max_bytes):
+    _worker.update(label_dir=label_dir, output_dir=output_dir, patch_map=patch_map, output_bgr=output_bgr,
+                   cache=SourceImageCache(image_dir, max_bytes=max_bytes, flags=flags))
+
+# 处理一个编号下的全部标签组合，返回 (成功数, [(样本名, 错误信息), ...])
+def _combine_group(img_id, label_files):
+    cache = _worker["cache"]
+    errors = []
+    done = 0
+    for label_file in label_files:
+        base = os.path.splitext(label_file)[0]
+        try:
+            img = cache.checkout(img_id)
+            if img is None:
+                raise FileNotFoundError(f"未找到或无法读取图像: {img_id}")
+            lines = load_label_lines(_worker["label_dir"], label_file)
+            img = synthesize_image(img, lines, _worker["patch_map"], base, _worker["output_bgr"],
+                                   cache.source_histogram(img_id))
+            if not cv2.imwrite(os.path.join(_worker["output_dir"], base + ".png"), img):
+                raise IOError(f"写入失败: {base}.png")
+            done += 1
+        except Exception as e:
+            errors.append((base, f"{type(e).__name__}: {e}"))
+    return done, errors
+
+# 按源图编号分片到进程池；每个样本的结果与 worker 数无关
+# max_bytes 为全部 worker 的源图缓存总预算，平均分给每个进程（至少保留一张图）
+def combine_images_parallel(image_dir, label_dir, output_dir, patch_map, label_files, flags, output_bgr, workers,
+                            max_bytes=DEFAULT_CACHE_BYTES):
+    groups = group_label_files(label_files)
+    done = 0
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(image_dir, label_dir, output_dir, patch_map, flags, output_bgr,
+                                       max_bytes // workers)) as ex:
+        futures = {ex.submit(_combine_group, img_id, files): (img_id, files) for img_id, files in groups.items()}
+        with tqdm(total=len(label_files), desc="Combining") as bar:
+            for fut in as_completed(futures):
+                img_id, files = futures[fut]
+                try:
+                    n, errors = fut.result()
+                except Exception as e:  # worker 进程本身崩溃
+                    n, errors = 0, [(os.path.splitext(f)[0], f"{type(e).__name__}: {e}") for f in files]
+                done += n
+                failures.extend(errors)
+                bar.update(len(files))
+
+    print(f"[OK] 已保存 {done} 张，失败 {len(failures)} 张")
+    for base, err in sorted(failures):
+        print(f"❌ 处理失败: {base}，错误: {err}")
+    return failures
+
+# 旧流程：写出 → Enhance_all 写入 tmp → 读回粘贴 bright，保留用于对照
+def combine_images_legacy(image_dir, label_dir, output_dir, tmpdir, patch_map, label_files):
+    for label_file in label_files:
+        img_id = label_file.split("_")[0]
+        base = os.path.splitext(label_file)[0]
+
+        image_path = find_image(image_dir, img_id)
+        if image_path is None:
+            print(f"[Skip] 未找到图像: {img_id}")
+            continue
+
+        img = cv2.imread(image_path)
+        if img is None:
+            print(f"[Error] 图像读取失败: {image_path}")
+            continue
+
+        lines = load_label_lines(label_dir, label_file)
+        paste_gray_patches(img, lines, patch_map, base)
+
+        save_name = base + ".png"
+        cv2.imwrite(os.path.join(output_dir, save_name), img)
+        print(f"[OK] 已保存: {save_name}")
+
+    Enhance_all(output_dir, tmpdir)
+
+    for label_file in label_files:
+        img_id = label_file.split("_")[0]
+        base = os.path.splitext(label_file)[0]
+
+        image_path = find_image(tmpdir, base)
+        if image_path is None:
+            print(f"[Skip] 未找到图像: {img_id}")
+            continue
+
+        img = cv2.imread(image_path)
+        if img is None:
+            print(f"[Error] 图像读取失败: {image_path}")
+            continue
+
+        lines = load_label_lines(label_dir, label_file)
+        paste_bright_patches(img, lines, patch_map)
+
+        save_name = base + ".png"
+        cv2.imwrite(os.path.join(output_dir, save_name), img)
+        print(f"[OK] 已保存: {save_name}")
@@ -0,0 +1,244 @@
+import random
+import hashlib
+import numpy as np
+from tools.label_store import LABEL_DTYPE
+
+# ----------- 按样本寻址的随机流 -----------
+
+def _id_key(image_id):
+    return int.from_bytes(hashlib.sha256(str(image_id).encode()).digest()[:8], "little")
+
+def sample_rng(seed, image_id, index):
+    """(seed, 图像编号, 组合序号) 决定的独立随机流（Philox，基于计数器）。
+
+    每个样本的结果与生成顺序、是否只生成其中一部分、在哪个进程生成都无关。
+    """
+    return np.random.Generator(np.random.Philox(np.random.SeedSequence([seed, _id_key(image_id), index])))
+
+# ----------- 标签读取 -----------
+
+# 替换 gray 的 class 为 1（防止混合后无法区分来源）
+def read_gray_lines(filepath):
+    with open(filepath, 'r') as f:
+        lines = [line.strip().split() for line in f if line.strip()]
+    for line in lines:
+        line[0] = '1'
+    return lines
+
+# 读取 bright 标签，保持原样（class 0）
+def read_bright_lines(filepath):
+    with open(filepath, 'r') as f:
+        return [line.strip().split() for line in f if line.strip()]
+
+# 标签行 → (N, 2) 的 float 坐标数组，只解析一次
+def labels_to_xy(labels):
+    return np.array([[float(l[1]), float(l[2])] for l in labels], dtype=np.float64).reshape(-1, 2)
+
+# ----------- 旧版纯 Python 采样（配合 random.seed 可复现旧输出） -----------
+
+# 判断组合中任意两个框之间是否都满足最小曼哈顿距离
+def check_min_manhattan(labels, min_dist):
+    for i in range(len(labels)):
+        xi, yi = float(labels[i][1]), float(labels[i][2])
+        for j in range(i + 1, len(labels)):
+            xj, yj = float(labels[j][1]), float(labels[j][2])
+            dist = abs(xi - xj) + abs(yi - yj)
+            if dist < min_dist:
+                return False
+    return True
+
+# 从 gray 和 bright 中抽样组合，直到满足最小距离要求
+def sample_valid_combination(gray_labels, bright_labels, gray_k, bright_k, min_dist, max_attempts=50000):
+    for _ in range(max_attempts):
+        gray_sample = random.sample(gray_labels, gray_k)
+        bright_sample = random.sample(bright_labels, bright_k)
+        merged = gray_sample + bright_sample
+        if check_min_manhattan(merged, min_dist):
+            return merged
+    return None
+
+# ----------- 向量化拒绝采样 -----------
+
+# 每行独立地从 n 个元素中无放回抽 k 个（随机键 + argpartition）
+def _batch_sample_indices(rng, batch, n, k):
+    keys = rng.random((batch, n))
+    if k < n:
+        return np.argpartition(keys, k - 1, axis=1)[:, :k]
+    return np.argsort(keys, axis=1)
+
+# 两两冲突矩阵：True 表示两点曼哈顿距离 < min_dist（gray 在前、bright 在后）
+def build_conflict_matrix(gray_xy, bright_xy, min_dist):
+    xy = np.concatenate([gray_xy, bright_xy], axis=0)
+    x, y = xy[:, 0], xy[:, 1]
+    dist = np.abs(x[:, None] - x[None, :]) + np.abs(y[:, None] - y[None, :])
+    return dist < min_dist
+
+# 批量检查 (B, K) 组下标是否两两无冲突；逐列推进，已冲突的行立即淘汰
+def batch_check_conflicts(conflict, idx):
+    alive = np.arange(len(idx))
+    for j in range(1, idx.shape[1]):
+        if len(alive) == 0:
+            break
+        rows = idx[alive]
+        hit = conflict[rows[:, j:j + 1], rows[:, :j]].any(axis=1)
+        alive = alive[~hit]
+    valid = np.zeros(len(idx), dtype=bool)
+    valid[alive] = True
+    return valid
+
+def sample_valid_combination_np(gray_xy, bright_xy, gray_k, bright_k, min_dist, rng,
+                                max_attempts=50000, batch=256, conflict=None):
+    """向量化版 sample_valid_combination。
+
+    gray_xy / bright_xy 为 labels_to_xy 得到的坐标数组。两两距离只在
+    build_conflict_matrix 中算一次（可由调用方传入 conflict 复用），之后每批
+    抽 batch 组候选、查表判断，返回第一组合法抽样的 (gray 下标, bright 下标)；
+    max_attempts 次内找不到时返回 None。
+    """
+    if conflict is None:
+        conflict = build_conflict_matrix(gray_xy, bright_xy, min_dist)
+    n_gray = len(gray_xy)
+    attempts = 0
+    while attempts < max_attempts:
+        b = min(batch, max_attempts - attempts)
+        attempts += b
+        gi = _batch_sample_indices(rng, b, n_gray, gray_k)
+        bi = _batch_sample_indices(rng, b, len(bright_xy), bright_k)
+        valid = batch_check_conflicts(conflict, np.concatenate([gi, bi + n_gray], axis=1))
+        if valid.any():
+            first = int(np.argmax(valid))
+            return gi[first], bi[first]
+    return None
+
+# ----------- 构造式采样（网格索引 + 回溯） -----------
+
+class ManhattanGridIndex:
+    """候选点的网格索引，用于快速查询曼哈顿距离 < min_dist 的邻居。
+
+    坐标旋转 45°（u = x + y, v = x - y）后 L1 距离变为 L∞ 距离，
+    以 min_dist 为边长划分网格，冲突点只可能落在相邻的 3×3 个格子里；
+    网格只做粗筛，最终仍按与 check_min_manhattan 相同的公式判定。
+    """
+
+    def __init__(self, xy, min_dist):
+        self.xy = xy
+        self.min_dist = min_dist
+        u = xy[:, 0] + xy[:, 1]
+        v = xy[:, 0] - xy[:, 1]
+        cell = min_dist * (1 + 1e-9)  # 防止浮点误差把边界点分到更远的格子
+        cu = np.floor(u / cell).astype(np.int64)
+        cv = np.floor(v / cell).astype(np.int64)
+        grid = {}
+        for i, key in enumerate(zip(cu.tolist(), cv.tolist())):
+            grid.setdefault(key, []).append(i)
+
+        # 每个点的冲突邻居（含自身）
+        self.neighbors = []
+        for i in range(len(xy)):
+            cand = [j for du in (-1, 0, 1) for dv in (-1, 0, 1)
+                    for j in grid.get((cu[i] + du, cv[i] + dv), ())]
+            cand = np.array(cand, dtype=np.int64)
+            dist = np.abs(xy[cand, 0] - xy[i, 0]) + np.abs(xy[cand, 1] - xy[i, 1])
+            self.neighbors.append(cand[dist < min_dist])
+
+def sample_valid_combination_constructive(gray_xy, bright_xy, gray_k, bright_k, min_dist, rng,
+                                          index=None, max_backtracks=10000):
+    """逐个挑点构造合法组合，返回 (gray 下标, bright 下标)，失败返回 None。
+
+    每一步只在与已选点都不冲突的候选中随机挑选（冲突计数由网格索引增量维护），
+    某类剩余候选不足时回溯到上一步并排除该选择。单次构造约 O(k · 邻居数 + k · n)，
+    不随合法率下降而退化，适合 gray_count + bright_count 较大或 min_dist 较大的场景。
+
+    分布说明：输出一定满足两两曼哈顿距离 >= min_dist，且每个合法组合都有正概率
+    被采到；但与拒绝采样不同，它不是合法组合上的均匀分布（冲突邻居少的点更容易
+    被选中）。需要严格均匀分布时请使用 sample_valid_combination_np / legacy。
+    """
+    n_gray = len(gray_xy)
+    if index is None:
+        index = ManhattanGridIndex(np.concatenate([gray_xy, bright_xy], axis=0), min_dist)
+    n = n_gray + len(bright_xy)
+    is_gray = np.zeros(n, dtype=bool)
+    is_gray[:n_gray] = True
+    type_mask = (is_gray, ~is_gray)
+
+    # 每一步抽取的类别（0=gray, 1=bright）随机排列，避免总是先填满某一类
+    order = rng.permutation(np.array([0] * gray_k + [1] * bright_k))
+    need = [gray_k, bright_k]
+    blocked = np.zeros(n, dtype=np.int32)  # 与已选点冲突的次数
+    chosen = []
+    excluded = [np.zeros(n, dtype=bool)]
+    backtracks = 0
+
+    while len(chosen) < len(order):
+        depth = len(chosen)
+        free = blocked == 0
+        cand = np.flatnonzero(free & type_mask[order[depth]] & ~excluded[depth])
+        # 剪枝：任一类别的剩余候选数少于还需要的数量
+        feasible = len(cand) > 0 and all(
+            np.count_nonzero(free & type_mask[t]) >= need[t] for t in (0, 1))
+        if feasible:
+            p = int(rng.choice(cand))
+            chosen.append(p)
+            need[order[depth]] -= 1
+            blocked[index.neighbors[p]] += 1
+            excluded.append(np.zeros(n, dtype=bool))
+            continue
+
+        if depth == 0 or backtracks >= max_backtracks:
+            return None
+        backtracks += 1
+        excluded.pop()
+        p = chosen.pop()
+        need[order[depth - 1]] += 1
+        blocked[index.neighbors[p]] -= 1
+        excluded[-1][p] = True
+
+    chosen = np.array(chosen, dtype=np.int64)
+    return chosen[chosen < n_gray], chosen[chosen >= n_gray] - n_gray
+
+# ----------- 单个图像的组合采样器 -----------
+
+class CombinationSampler:
+    """一个图像的 gray / bright 候选标签，以及按采样方式预先建好的冲突矩阵或网格索引。
+
+    sample(rng) 返回一组合法组合的标签记录（gray 在前，class 已分别为 1 / 0），找不到时返回 None。
+    legacy 方式使用 random 模块的全局随机流，忽略 rng。
+    """
+
+    def __init__(self, gray_rec, bright_rec, gray_k, bright_k, min_dist, sampler="numpy"):
+        self.gray_rec = gray_rec.copy()
+        self.gray_rec['cls'] = 1  # 替换 gray 的 class 为 1（防止混合后无法区分来源）
+        self.bright_rec = bright_rec
+        self.gray_k = gray_k
+        self.bright_k = bright_k
+        self.min_dist = min_dist
+        self.sampler = sampler
+
+        # 坐标列直接取自标签记录，所有组合共用
+        self.gray_xy = np.column_stack([self.gray_rec['x'], self.gray_rec['y']])
+        self.bright_xy = np.column_stack([bright_rec['x'], bright_rec['y']])
+        if sampler == 'constructive':
+            self.index = ManhattanGridIndex(np.concatenate([self.gray_xy, self.bright_xy], axis=0), min_dist)
+        elif sampler == 'numpy':
+            self.conflict = build_conflict_matrix(self.gray_xy, self.bright_xy, min_dist)
+
+    def enough_labels(self):
+        return len(self.gray_rec) >= self.gray_k and len(self.bright_rec) >= self.bright_k
+
+    def sample(self, rng):
+        if self.sampler == 'legacy':
+            # random.sample 只依赖长度和随机流，传记录元组与传文本行抽到的位置相同
+            sample = sample_valid_combination(
+                self.gray_rec.tolist(), self.bright_rec.tolist(), self.gray_k, self.bright_k, self.min_dist
+            )
+            return None if sample is None else np.array(sample, dtype=LABEL_DTYPE)
+        if self.sampler == 'constructive':
+            idx = sample_valid_combination_constructive(
+                self.gray_xy, self.bright_xy, self.gray_k, self.bright_k, self.min_dist, rng, index=self.index
+            )
+        else:
+            idx = sample_valid_combination_np(
+                self.gray_xy, self.bright_xy, self.gray_k, self.bright_k, self.min_dist, rng,
+                conflict=self.conflict
+            )
+        return None if idx is None else np.concatenate([self.gray_rec[idx[0]], self.bright_rec[idx[1]]])
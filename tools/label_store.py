@@ -0,0 +1,114 @@
+import os
+import hashlib
+import numpy as np
+
+# 每个框一条记录：类别 + YOLO 归一化坐标（float64，与 float() 解析文本的结果完全一致）
+LABEL_DTYPE = np.dtype([('cls', np.int16), ('x', np.float64), ('y', np.float64),
+                        ('w', np.float64), ('h', np.float64)])
+
+# 单个 YOLO txt → 结构化数组；不足 5 列的 w/h 记为 NaN
+def parse_yolo_file(path):
+    rows = []
+    with open(path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 3:
+                continue
+            vals = [float(v) for v in parts[1:5]] + [np.nan] * (5 - len(parts))
+            rows.append((int(parts[0]), *vals))
+    return np.array(rows, dtype=LABEL_DTYPE)
+
+# 结构化数组 → YOLO 文本行
+def format_yolo_lines(records):
+    lines = []
+    for cls, x, y, w, h in records.tolist():
+        if np.isnan(w) or np.isnan(h):
+            lines.append(f"{cls} {x:.6f} {y:.6f}")
+        else:
+            lines.append(f"{cls} {x:.6f} {y:.6f} {w:.6f} {h:.6f}")
+    return lines
+
+class LabelStore:
+    """一个数据集的全部标签：一张扁平的记录表 + 每个图像的偏移索引。
+
+    names[i] 的标签为 records[offsets[i]:offsets[i + 1]]。
+    保存为目录下的 names.npy / offsets.npy / records.npy，可按 mmap 方式加载，
+    流水线内部都读写该格式，只在最后一步 export_yolo 导出 .txt。
+    """
+
+    def __init__(self, names, offsets, records):
+        self.names = list(names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.records = records
+        self._index = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        i = self._index[name]
+        return self.records[self.offsets[i]:self.offsets[i + 1]]
+
+    # 单个图像标签记录的内容哈希（流水线按条目判断输入是否变化）
+    def digest(self, name):
+        return hashlib.sha256(np.ascontiguousarray(self[name]).tobytes()).hexdigest()
+
+    def items(self):
+        for i, name in enumerate(self.names):
+            yield name, self.records[self.offsets[i]:self.offsets[i + 1]]
+
+    @classmethod
+    def from_dict(cls, labels):
+        names = list(labels)
+        counts = [len(labels[n]) for n in names]
+        offsets = np.concatenate([[0], np.cumsum(counts, dtype=np.int64)])
+        records = np.concatenate([labels[n] for n in names]) if names else np.empty(0, dtype=LABEL_DTYPE)
+        return cls(names, offsets, records.astype(LABEL_DTYPE, copy=False))
+
+    @classmethod
+    def from_dir(cls, label_dir):
+        labels = {}
+        for fname in sorted(os.listdir(label_dir)):
+            if not fname.endswith(".txt") or fname == "classes.txt":
+                continue
+            labels[os.path.splitext(fname)[0]] = parse_yolo_file(os.path.join(label_dir, fname))
+        return cls.from_dict(labels)
+
+    def save(self, store_dir):
+        os.makedirs(store_dir, exist_ok=True)
+        np.save(os.path.join(store_dir, "names.npy"), np.array(self.names, dtype=str))
+        np.save(os.path.join(store_dir, "offsets.npy"), self.offsets)
+        np.save(os.path.join(store_dir, "records.npy"), self.records)
+
+    @classmethod
+    def load(cls, store_dir, mmap=True):
+        mode = 'r' if mmap else None
+        names = np.load(os.path.join(store_dir, "names.npy")).tolist()
+        offsets = np.load(os.path.join(store_dir, "offsets.npy"), mmap_mode=mode)
+        records = np.load(os.path.join(store_dir, "records.npy"), mmap_mode=mode)
+        return cls(names, offsets, records)
+
+    def export_yolo(self, label_dir):
+        os.makedirs(label_dir, exist_ok=True)
+        for name, records in self.items():
+            lines = format_yolo_lines(records)
+            with open(os.path.join(label_dir, name + ".txt"), 'w') as f:
+                f.write("\n".join(lines) + "\n" if lines else "")
+
+# 读取标签：优先用已保存的 store，没有或比源目录旧时从 txt 重建并保存
+def load_label_store(label_dir, store_dir=None):
+    if store_dir is None:
+        return LabelStore.from_dir(label_dir)
+    records_path = os.path.join(store_dir, "records.npy")
+    if os.path.exists(records_path):
+        newest = max((os.stat(os.path.join(label_dir, f)).st_mtime for f in os.listdir(label_dir)),
+                     default=0)
+        newest = max(newest, os.stat(label_dir).st_mtime)
+        if os.stat(records_path).st_mtime >= newest:
+            return LabelStore.load(store_dir)
+    store = LabelStore.from_dir(label_dir)
+    store.save(store_dir)
+    return store
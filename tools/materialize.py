@@ -0,0 +1,74 @@
+import os
+import sys
+import shutil
+from collections import Counter
+
+# copy: 完整复制；hardlink: 硬链接（同一文件系统，零拷贝）；
+# reflink: 写时复制克隆（btrfs / xfs 等，数据独立但不占额外空间）；
+# symlink: 符号链接（指向源文件绝对路径）；move: 直接移动（源目录是临时目录时使用）
+MATERIALIZE_MODES = ("copy", "hardlink", "reflink", "symlink", "move")
+# 保留源文件的方式。流水线的中间目录之后还要作为增量生成的输出和输入，
+# move 会把它们搬空（下次运行时阶段被跳过、条目数为 0），只适合一次性工具
+KEEP_SOURCE_MODES = tuple(m for m in MATERIALIZE_MODES if m != "move")
+
+FICLONE = 0x40049409  # linux/fs.h
+
+def _reflink(src, dst):
+    if not sys.platform.startswith("linux"):
+        raise OSError("reflink 仅支持 Linux (FICLONE)")
+    import fcntl
+    with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+        try:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        except OSError:
+            fd.close()
+            os.remove(dst)
+            raise
+
+def materialize(src, dst, mode="copy"):
+    """把 src 放到 dst，返回实际使用的方式。
+
+    hardlink / reflink / symlink 在当前文件系统不支持时（跨设备、权限、不支持克隆等）
+    自动退回 copy。注意 hardlink / symlink 与源文件共享数据，之后原地改写源文件会同时
+    影响 dst。
+    """
+    if mode not in MATERIALIZE_MODES:
+        raise ValueError(f"未知的 materialize 方式: {mode}")
+    # 先删除已有的 dst：可能是上次 hardlink / symlink 留下的、与 src 指向同一文件的链接，
+    # 直接 copy 会报 SameFileError 或写穿到源文件
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == "move":
+        shutil.move(src, dst)
+        return "move"
+    if mode != "copy":
+        try:
+            if mode == "hardlink":
+                os.link(src, dst)
+            elif mode == "symlink":
+                os.symlink(os.path.abspath(src), dst)
+            else:
+                _reflink(src, dst)
+            return mode
+        except (OSError, NotImplementedError):
+            pass
+    if os.path.lexists(dst):
+        os.remove(dst)  # reflink 失败时可能留下空文件
+    shutil.copy(src, dst)
+    return "copy"
+
+class MaterializeStats:
+    """统计每种方式实际处理的文件数，便于发现退回 copy 的情况。"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.counts = Counter()
+
+    def __call__(self, src, dst):
+        self.counts[materialize(src, dst, self.mode)] += 1
+
+    def summary(self):
+        parts = ", ".join(f"{k}: {v}" for k, v in sorted(self.counts.items()))
+        fallback = self.counts["copy"] if self.mode not in ("copy", "move") else 0
+        note = f"（{fallback} 个文件退回 copy）" if fallback else ""
+        return f"materialize={self.mode} → {parts or '无文件'}{note}"
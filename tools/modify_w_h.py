@@ -1,5 +1,6 @@
 import os
 import argparse
+import numpy as np
 
 def judge_direction(x, y):
     dx = x - 0.5
@@ -16,6 +17,39 @@ def classify_point(x, y, target_w, target_h):
     else:
         return target_h, target_w  # 横 patch
 
+# 向量化版 judge_direction：x, y 为同形状数组
+def judge_direction_np(x, y):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    vertical = np.abs(y - 0.5) > np.abs(x - 0.5)
+    return np.where(vertical, np.where(y < 0.5, 0, 2), np.where(x < 0.5, 3, 1))
+
+# 向量化版 classify_point，返回 (w, h) 两个数组
+def classify_points(x, y, target_w, target_h):
+    vertical = np.isin(judge_direction_np(x, y), (0, 2))
+    w = np.where(vertical, target_w, target_h)
+    h = np.where(vertical, target_h, target_w)
+    return w, h
+
+# 在写出之前直接给标签记录（含 x, y, w, h 字段的结构化数组）赋 w/h，
+# 越界的点与 modify_wh_by_direction 一样被丢弃
+def apply_wh_by_direction(records, w_l, h_l):
+    x, y = records['x'], records['y']
+    records = records[(x >= 0) & (x <= 1) & (y >= 0) & (y <= 1)].copy()
+    records['w'], records['h'] = classify_points(records['x'], records['y'], w_l, h_l)
+    return records
+
+# 对 (cls 字符串列表, x, y) 直接生成最终 YOLO 行，结果与先写出再 modify_wh_by_direction 相同
+def format_lines_by_direction(cls, x, y, w_l, h_l):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = (x >= 0) & (x <= 1) & (y >= 0) & (y <= 1)
+    w, h = classify_points(x, y, w_l, h_l)
+    return [f"{c} {xi:.6f} {yi:.6f} {wi:.6f} {hi:.6f}"
+            for c, xi, yi, wi, hi, k in zip(cls, x.tolist(), y.tolist(), w.tolist(), h.tolist(), keep.tolist())
+            if k]
+
+# 旧工具：对已写出的目录逐个文件原地改写（用于历史目录）
 def modify_wh_by_direction(label_dir, w_l, h_l):
     for fname in os.listdir(label_dir):
         if not fname.endswith(".txt") or fname == "classes.txt":
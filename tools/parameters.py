@@ -16,12 +16,25 @@ replacement_left = np.array([
     [208, 200, 216, 200, 208]
 ], dtype=np.uint8)
 replacement_left = np.tile(replacement_left, (6, 6))
+# single-channel versions for the grayscale-native path
+replacement_right_gray = replacement_right
+replacement_left_gray = replacement_left
 replacement_right = np.stack([replacement_right]*3, axis=-1)
 replacement_left = np.stack([replacement_left]*3, axis=-1)
 w_b = 8
 h_b = 10
 w_g = 10
 h_g = 20
+# pre-sized patch variants (w_b, h_b, w_g, h_g) stored in the patch bank; the first one is the default
+patch_sizes = [(w_b, h_b, w_g, h_g)]
+# memory-mapped patch bank cache, keyed by a hash of the sizes and patch sources
+patch_bank_dir = "cache/patch_bank"
+# keep images, patches and enhancement single-channel uint8 H×W
+gray_native = True
+# expand the final images to 3 channels for YOLO consumers that require it
+output_bgr = True
+# decoded source image cache budget (MB), shared by all label combinations
+source_cache_mb = 512
 # these parameters are for random labels settings
 gray_count = 15
 bright_count = 15
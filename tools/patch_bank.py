@@ -0,0 +1,103 @@
+import os
+import json
+import shutil
+import numpy as np
+from tools.image_synth import load_patch_map
+from tools.pipeline import hash_params, hash_paths, fingerprint
+
+# 缓存格式版本，改动存储布局时递增，旧缓存自动失效
+PATCH_BANK_VERSION = 1
+
+def patch_bank_key(patch_root, sizes, replacement_left, replacement_right, gray):
+    """缓存键：尺寸、通道模式、replacement 数组和 patch 文件内容的哈希。"""
+    params = {"version": PATCH_BANK_VERSION, "sizes": [list(s) for s in sizes], "gray": bool(gray),
+              "replacement_left": replacement_left, "replacement_right": replacement_right}
+    return fingerprint(hash_params(params), hash_paths([patch_root]))
+
+class BankPatchMap(dict):
+    """PatchBank 中某个尺寸的 patch_map，值是 mmap 数据的只读视图。
+
+    pickle 时只传缓存目录和尺寸，worker 进程直接 mmap 同一个文件，不重新解码、缩放；
+    未保存到磁盘的库（bank_dir 为 None）按普通 dict 传递 patch 数据。
+    """
+
+    def __init__(self, patches, bank_dir, size):
+        super().__init__(patches)
+        self.bank_dir = bank_dir
+        self.size = size
+
+    def __reduce__(self):
+        if self.bank_dir is None:
+            return dict, (dict(self),)
+        return _load_bank_patch_map, (self.bank_dir, self.size)
+
+def _load_bank_patch_map(bank_dir, size):
+    return PatchBank.load(bank_dir).patch_map(size)
+
+class PatchBank:
+    """按尺寸预先缩放好的全部 patch，存为一个扁平 uint8 数组 + 索引。
+
+    sizes 为 (w_b, h_b, w_g, h_g) 列表，每个尺寸一套完整的 patch_map；
+    保存为目录下的 data.npy / index.json，按 mmap 方式加载，多个进程共享同一份页缓存。
+    """
+
+    def __init__(self, data, index, bank_dir=None):
+        self.data = data
+        self.index = index
+        self.bank_dir = bank_dir
+        self.sizes = [tuple(s) for s in index["sizes"]]
+
+    def patch_map(self, size=None):
+        size = self.sizes[0] if size is None else tuple(size)
+        patches = {}
+        for light, dir_id, offset, shape in self.index["patches"][self.sizes.index(size)]:
+            count = int(np.prod(shape))
+            patches[(light, dir_id)] = self.data[offset:offset + count].reshape(shape)
+        return BankPatchMap(patches, self.bank_dir, size)
+
+    @classmethod
+    def build(cls, patch_root, sizes, replacement_left, replacement_right, gray=False):
+        chunks, entries, offset = [], [], 0
+        for w_b, h_b, w_g, h_g in sizes:
+            patch_map = load_patch_map(patch_root, w_b, h_b, w_g, h_g, replacement_left, replacement_right, gray=gray)
+            variant = []
+            for (light, dir_id), patch in patch_map.items():
+                chunks.append(np.ascontiguousarray(patch, dtype=np.uint8).ravel())
+                variant.append([light, dir_id, offset, list(patch.shape)])
+                offset += patch.size
+            entries.append(variant)
+        data = np.concatenate(chunks) if chunks else np.empty(0, dtype=np.uint8)
+        return cls(data, {"sizes": [list(s) for s in sizes], "gray": bool(gray), "patches": entries})
+
+    def save(self, bank_dir):
+        # 先写临时目录再改名，多个进程同时构建时不会读到半成品
+        tmp_dir = f"{bank_dir}.tmp{os.getpid()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+        np.save(os.path.join(tmp_dir, "data.npy"), self.data)
+        with open(os.path.join(tmp_dir, "index.json"), 'w') as f:
+            json.dump(self.index, f)
+        try:
+            os.rename(tmp_dir, bank_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)  # 其他进程已写好
+        self.bank_dir = bank_dir
+
+    @classmethod
+    def load(cls, bank_dir, mmap=True):
+        data = np.load(os.path.join(bank_dir, "data.npy"), mmap_mode='r' if mmap else None)
+        with open(os.path.join(bank_dir, "index.json"), 'r') as f:
+            index = json.load(f)
+        return cls(data, index, bank_dir)
+
+# 读取 patch 库：缓存目录中已有相同参数的库时直接 mmap，否则构建并保存
+def load_patch_bank(patch_root, sizes, replacement_left, replacement_right, gray=False, cache_dir=None):
+    sizes = [tuple(s) for s in sizes]
+    if cache_dir is None:
+        return PatchBank.build(patch_root, sizes, replacement_left, replacement_right, gray=gray)
+    key = patch_bank_key(patch_root, sizes, replacement_left, replacement_right, gray)
+    bank_dir = os.path.join(cache_dir, key[:16])
+    if not os.path.exists(os.path.join(bank_dir, "index.json")):
+        os.makedirs(cache_dir, exist_ok=True)
+        PatchBank.build(patch_root, sizes, replacement_left, replacement_right, gray=gray).save(bank_dir)
+        print(f"[PatchBank] 已构建: {bank_dir}")
+    return PatchBank.load(bank_dir)
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+# 每个输出目录下的清单文件，记录上次生成时的指纹
+MANIFEST_NAME = ".manifest.json"
+
+_file_hash_memo = {}
+
+# 文件内容哈希（同一进程内按 size + mtime 记忆，避免重复读取）
+def hash_file(path):
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    digest = _file_hash_memo.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _file_hash_memo[key] = digest
+    return digest
+
+# 文件或目录（递归）的内容哈希；不存在的路径也参与哈希，保证出现/消失都能被感知
+def hash_paths(paths):
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        h.update(path.encode())
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for fname in sorted(files):
+                    if fname == MANIFEST_NAME:
+                        continue
+                    fpath = os.path.join(root, fname)
+                    h.update(os.path.relpath(fpath, path).encode())
+                    h.update(hash_file(fpath).encode())
+        elif os.path.exists(path):
+            h.update(hash_file(path).encode())
+        else:
+            h.update(b"<missing>")
+    return h.hexdigest()
+
+def _jsonable(value):
+    if isinstance(value, np.ndarray):
+        return {"dtype": str(value.dtype), "shape": value.shape, "data": value.tolist()}
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return repr(value)
+
+def hash_params(params):
+    text = json.dumps(params, sort_keys=True, default=_jsonable)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def fingerprint(*parts):
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_manifest(output_dir, manifest):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+# 单个输出文件的签名 [size, mtime_ns, sha256]；size / mtime 与 previous 相同时沿用旧哈希，不重新读取
+def output_signature(path, previous=None):
+    st = os.stat(path)
+    if previous is not None and previous[:2] == [st.st_size, st.st_mtime_ns]:
+        return previous
+    return [st.st_size, st.st_mtime_ns, hash_file(path)]
+
+# 目录（递归）下的全部输出文件路径，不含清单
+def list_outputs(dirs):
+    paths = []
+    for d in dirs:
+        for root, subdirs, files in os.walk(d):
+            subdirs.sort()
+            paths.extend(os.path.join(root, f) for f in sorted(files) if not f.startswith(MANIFEST_NAME))
+    return paths
+
+def snapshot_outputs(paths, previous=None):
+    previous = previous or {}
+    return {path: output_signature(path, previous.get(path)) for path in paths if os.path.lexists(path)}
+
+# 输出与清单记录一致：文件存在，内容哈希相同（size / mtime 未变时视为未改动）
+def output_intact(path, recorded):
+    if recorded is None or not os.path.exists(path):
+        return False
+    return output_signature(path, recorded)[2] == recorded[2]
+
+# 删除清单中记录、但本次不再产出（或即将重新生成）的旧文件
+def prune_outputs(paths):
+    for path in paths:
+        if os.path.lexists(path):
+            os.remove(path)
+    if paths:
+        print(f"[Prune] 删除 {len(paths)} 个旧输出")
+
+class Stage:
+    """流水线中的一个阶段。
+
+    run(only)  : 执行阶段；only 为需要重新生成的条目集合，None 表示全部。
+                 按条目运行时，若只有条目被删除，会以空集合调用一次，便于阶段更新汇总输出（如标签库）。
+                 返回失败条目列表（[(条目, 错误信息), ...]）或 None。
+    inputs     : 整个阶段共享的输入文件/目录
+    params     : 影响该阶段输出的参数（dict）
+    code       : 实现该阶段的源码文件，作为代码版本参与指纹
+    output_dir : 输出目录，清单写在这里
+    outputs    : 其他输出目录（如划分时的标签目录），与 output_dir 一起记录、校验和清理
+    items      : 可选，返回 {条目: (该条目专属输入文件列表, 输出文件路径[, 附加指纹])}；
+                 提供时按条目增量生成，只重做指纹变化、输出缺失或被改动的条目。
+                 附加指纹为字符串，用于不是独立文件的输入（如标签库中该条目的那一段记录）
+
+    清单记录每个输出文件的签名。整阶段运行时输出被删除、改写或多出文件都会触发重跑，
+    重跑前先删除上次记录的全部输出；按条目运行时删除不再属于任何条目的旧输出，
+    保证减少组合数等情况下不会把过期文件带入后续阶段。
+    """
+
+    def __init__(self, name, run, output_dir, inputs=(), params=None, code=(), items=None, outputs=()):
+        self.name = name
+        self.run = run
+        self.output_dir = output_dir
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.code = list(code)
+        self.items = items
+        self.output_dirs = [output_dir] + list(outputs)
+
+    def fingerprint(self):
+        return fingerprint(hash_params(self.params), hash_paths(self.inputs), hash_paths(self.code))
+
+def _run_whole(stage, stage_fp, manifest, force, t0):
+    recorded = manifest.get("outputs")
+    current = list_outputs(stage.output_dirs)
+    if (not force and manifest.get("stage") == stage_fp and recorded is not None
+            and set(recorded) == set(current) and all(output_intact(p, recorded[p]) for p in current)):
+        print(f"[Skip] {stage.name}: 输入和输出均未变化")
+        return
+    if recorded:
+        # 输入或输出有变化：上次的产物全部作废，先删除，避免旧文件残留
+        prune_outputs([p for p in recorded if os.path.lexists(p)])
+    failures = stage.run(None) or []
+    if failures:
+        raise RuntimeError(f"{stage.name} 有 {len(failures)} 个条目失败: {failures[:5]}")
+    outputs = snapshot_outputs(list_outputs(stage.output_dirs))
+    save_manifest(stage.output_dir, {"stage": stage_fp, "items": {}, "outputs": outputs, "time": time.time()})
+    print(f"[OK] {stage.name}: 完成（{time.time() - t0:.1f}s）")
+
+def run_stage(stage, force=False):
+    t0 = time.time()
+    stage_fp = stage.fingerprint()
+    manifest = load_manifest(stage.output_dir)
+
+    if stage.items is None:
+        _run_whole(stage, stage_fp, manifest, force, t0)
+        return
+
+    items = stage.items()
+    item_fps = {key: fingerprint(stage_fp, hash_paths(item[0]), *item[2:]) for key, item in items.items()}
+    old_items = manifest.get("items", {})
+    # 旧版清单没有输出签名，只能按文件是否存在判断
+    tracked = "outputs" in manifest
+    recorded = manifest.get("outputs", {})
+    produced = {item[1] for item in items.values()}
+    prune_outputs([p for p in recorded if p not in produced and os.path.lexists(p)])
+
+    if force:
+        changed = set(items)
+    else:
+        changed = {key for key, fp in item_fps.items()
+                   if old_items.get(key) != fp or not (output_intact(items[key][1], recorded.get(items[key][1]))
+                                                       if tracked else os.path.exists(items[key][1]))}
+
+    def save():
+        outputs = snapshot_outputs([items[key][1] for key in item_fps], recorded)
+        save_manifest(stage.output_dir, {"stage": stage_fp, "items": item_fps, "outputs": outputs,
+                                         "time": time.time()})
+
+    removed = set(old_items) - set(items)
+    if not changed and not removed:
+        if not tracked or set(recorded) != produced:
+            save()
+        print(f"[Skip] {stage.name}: {len(items)} 个条目均未变化")
+        return
+
+    if changed:
+        print(f"[Run] {stage.name}: 重新生成 {len(changed)} / {len(items)} 个条目")
+    else:
+        print(f"[Run] {stage.name}: 删除 {len(removed)} 个条目，其余 {len(items)} 个未变化")
+    failures = stage.run(changed) or []
+    failed = {key for key, _ in failures}
+    for key in failed:
+        item_fps.pop(key, None)
+    save()
+    if failed:
+        raise RuntimeError(f"{stage.name} 有 {len(failed)} 个条目失败: {sorted(failed)[:5]}")
+    print(f"[OK] {stage.name}: 完成（{time.time() - t0:.1f}s）")
+
+# 依次执行各阶段；任一阶段出错立即停止，不再像 subprocess 链那样忽略返回码
+def run_pipeline(stages, force=False):
+    for i, stage in enumerate(stages, 1):
+        print(f"Step {i}: {stage.name}")
+        run_stage(stage, force=force)
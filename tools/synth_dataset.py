@@ -0,0 +1,119 @@
+import os
+import tools.parameters as pr
+from tools.image_cache import SourceImageCache, imread_flags
+from tools.image_synth import synthesize_image
+from tools.label_sampler import CombinationSampler, sample_rng
+from tools.label_store import load_label_store
+from tools.modify_w_h import apply_wh_by_direction
+from tools.patch_bank import load_patch_bank
+
+class SyntheticYoloDataset:
+    """按需合成的随机组合样本，第 i 项为 (image, labels)，全程在内存中完成，不写磁盘。
+
+    标签抽样与 random_labels_combine 相同（CombinationSampler），图像合成与
+    random_images_combine 相同（synthesize_image）。labels 为 LabelStore 记录数组
+    （cls / x / y / w / h）。
+
+    样本 i 对应编号 ids[i % len(ids)] 的第 epoch * samples_per_id + i // len(ids) 个组合，
+    随机流为 sample_rng(seed, 编号, 组合序号)：epoch 0 与 random_labels_combine 用相同 seed
+    生成的标签一致；set_epoch() 取后续序号的一批全新组合，不受 num_combinations 限制。
+
+    sampler 只能是 "numpy" / "constructive"：legacy 采样使用 random 的全局随机流，
+    结果取决于访问顺序和 worker 交错，不满足按索引确定。
+
+    源图缓存、patch 和冲突矩阵在每个进程中首次使用时建立，可直接作为 map-style
+    数据集交给多进程 loader（每个 worker 各有一份缓存）。
+    """
+
+    def __init__(self, image_dir, gray_label_dir, bright_label_dir, store_root=None, samples_per_id=None,
+                 seed=42, sampler="numpy", patch_root="patches_texture", gray=None, output_bgr=None):
+        if sampler not in ("numpy", "constructive"):
+            raise ValueError(f"不支持的采样方式: {sampler}（可选 numpy / constructive；legacy 依赖全局随机流，结果与访问顺序有关）")
+        self.image_dir = image_dir
+        self.seed = seed
+        self.sampler = sampler
+        self.patch_root = patch_root
+        self.gray = pr.gray_native if gray is None else gray
+        self.output_bgr = pr.output_bgr if output_bgr is None else output_bgr
+        self.samples_per_id = pr.num_combinations if samples_per_id is None else samples_per_id
+        self.epoch = 0
+
+        self.gray_store = load_label_store(
+            gray_label_dir, None if store_root is None else os.path.join(store_root, "gray_all"))
+        self.bright_store = load_label_store(
+            bright_label_dir, None if store_root is None else os.path.join(store_root, "bright_all"))
+        common = set(self.gray_store.names) & set(self.bright_store.names)
+        self.ids = [name for name in sorted(common)
+                    if len(self.gray_store[name]) >= pr.gray_count and len(self.bright_store[name]) >= pr.bright_count]
+        self._reset_worker_state()
+
+    def _reset_worker_state(self):
+        self._pid = os.getpid()
+        self._cache = None
+        self._patch_map = None
+        self._samplers = {}
+
+    # 子进程（fork 或 spawn）中首次访问时重新建立缓存，不继承 / 不序列化父进程的缓存
+    def _worker_state(self):
+        if self._pid != os.getpid():
+            self._reset_worker_state()
+        if self._cache is None:
+            self._cache = SourceImageCache(self.image_dir, max_bytes=pr.source_cache_mb * 1024 * 1024,
+                                           flags=imread_flags(self.gray))
+            replacement_right = pr.replacement_right_gray if self.gray else pr.replacement_right
+            replacement_left = pr.replacement_left_gray if self.gray else pr.replacement_left
+            size = (pr.w_b, pr.h_b, pr.w_g, pr.h_g)
+            sizes = list(dict.fromkeys([size] + list(pr.patch_sizes)))
+            bank = load_patch_bank(self.patch_root, sizes, replacement_left, replacement_right, gray=self.gray,
+                                   cache_dir=pr.patch_bank_dir)
+            self._patch_map = bank.patch_map(size)
+        return self._cache, self._patch_map
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update(_pid=None, _cache=None, _patch_map=None, _samplers={})
+        return state
+
+    def __len__(self):
+        return len(self.ids) * self.samples_per_id
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def sample_name(self, index):
+        name = self.ids[index % len(self.ids)]
+        return f"{name}_{self.combination_index(index)}"
+
+    def combination_index(self, index):
+        return self.epoch * self.samples_per_id + index // len(self.ids)
+
+    def labels(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        name = self.ids[index % len(self.ids)]
+        pool = self._samplers.get(name)
+        if pool is None:
+            pool = CombinationSampler(self.gray_store[name], self.bright_store[name], pr.gray_count,
+                                      pr.bright_count, pr.min_manhattan_distance, self.sampler)
+            self._samplers[name] = pool
+        sample = pool.sample(sample_rng(self.seed, name, self.combination_index(index)))
+        if sample is None:
+            raise RuntimeError(f"找不到合法组合: {self.sample_name(index)}")
+        return apply_wh_by_direction(sample, pr.w_l, pr.h_l)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        cache, patch_map = self._worker_state()
+        labels = self.labels(index)
+        base = self.sample_name(index)
+        img_id = base.split("_")[0]
+        img = cache.checkout(img_id)
+        if img is None:
+            raise IOError(f"未找到或无法读取图像: {base}")
+        return synthesize_image(img, labels.tolist(), patch_map, base, self.output_bgr,
+                                cache.source_histogram(img_id)), labels
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
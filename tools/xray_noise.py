@@ -0,0 +1,177 @@
+import os
+import hashlib
+import cv2
+import numpy as np
+
+# ===================== 参数设置 =====================
+# 定义不同噪声等级的 Poisson–Gaussian 参数 (α 和 σ²)
+# α: 泊松噪声强度参数（模拟光子计数的尺度因子）
+# σ²: 高斯噪声方差 (σ 为标准差的值平方)
+NONE_ALPHA = None      # 无噪声时不应用泊松噪声
+NONE_SIGMA2 = 0.0      # 无噪声时不添加高斯噪声
+
+MILD_ALPHA = 50.0      # 轻度噪声: 较高光子计数 (泊松噪声小)
+MILD_SIGMA2 = 0.001    # 轻度噪声: 很小的高斯噪声方差
+
+MODERATE_ALPHA = 20.0  # 中度噪声: 中等光子计数
+MODERATE_SIGMA2 = 0.005# 中度噪声: 中等高斯噪声方差
+
+SEVERE_ALPHA = 5.0     # 重度噪声: 较低光子计数 (泊松噪声显著)
+SEVERE_SIGMA2 = 0.02   # 重度噪声: 较大的高斯噪声方差
+
+# 噪声级别名称列表，方便迭代
+noise_levels = [
+    ("none",    NONE_ALPHA,    NONE_SIGMA2),
+    ("mild",    MILD_ALPHA,    MILD_SIGMA2),
+    ("moderate",MODERATE_ALPHA,MODERATE_SIGMA2),
+    ("severe",  SEVERE_ALPHA,  SEVERE_SIGMA2)
+]
+NOISE_LEVELS = {level: (alpha, sigma2) for level, alpha, sigma2 in noise_levels}
+
+image_exts = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def _key(text):
+    return int.from_bytes(hashlib.sha256(str(text).replace(os.sep, "/").encode()).digest()[:8], "little")
+
+
+def noise_rng(seed, image_id, stream):
+    """(seed, image_id, stream) 决定的独立随机流，与处理顺序、进程数无关。
+
+    stream 为级别名（该级别的泊松分量）或 "gaussian"（各级别共用的标准正态场），
+    因此单独生成某一级别与一次生成全部级别得到的结果相同。
+    """
+    return np.random.Generator(np.random.PCG64(np.random.SeedSequence([seed, _key(image_id), _key(stream)])))
+
+
+def _normalize(image, lock_channels):
+    max_val = 255.0 if image.dtype == np.uint8 else 65535.0
+    # pick a single-channel base for noise (if image is 3-channel grayscale)
+    if lock_channels and image.ndim == 3:
+        base = image[..., 0].astype(np.float32)
+    else:
+        base = image.astype(np.float32)
+    base *= np.float32(1.0 / max_val)
+    return base, max_val
+
+
+def _apply_level(image, base, max_val, alpha, sigma2, poisson_rng, normal, lock_channels):
+    # Poisson part
+    if alpha is not None:
+        y = poisson_rng.poisson(np.maximum(base, 0.0) * float(alpha)).astype(np.float32)
+        y *= np.float32(1.0 / float(alpha))
+    else:
+        y = base.copy()
+
+    # Gaussian part
+    if sigma2 > 0:
+        y += normal() * np.float32(float(sigma2) ** 0.5)
+
+    np.clip(y, 0.0, 1.0, out=y)
+    y *= np.float32(max_val)
+    y = y.astype(image.dtype)
+
+    # broadcast back to match original channels
+    if lock_channels and image.ndim == 3:
+        y = cv2.merge([y] * image.shape[2])
+    return y
+
+
+def add_noise_levels(image, levels, seed=0, image_id="", lock_channels=True):
+    """一次归一化，按 levels 生成多档 Poisson–Gaussian 噪声图，返回 {级别: 图像}。
+
+    各档共用归一化后的强度基和同一个标准正态场（按各自的 σ 缩放），
+    每档的噪声分布与单独生成时相同，只是同一张图的各档高斯分量相关。
+    alpha 为 None 且 σ²=0 的级别直接返回原图（不复制）。
+    三通道图像在 lock_channels 时只在单通道上计算，最后再合并成多通道；单通道图像不做扩展。
+    """
+    if all(alpha is None and sigma2 <= 0 for _, alpha, sigma2 in levels):
+        return {level: image for level, _, _ in levels}
+    base, max_val = _normalize(image, lock_channels)
+
+    field = []
+    def normal():
+        if not field:
+            field.append(noise_rng(seed, image_id, "gaussian").standard_normal(size=base.shape, dtype=np.float32))
+        return field[0]
+
+    outputs = {}
+    for level, alpha, sigma2 in levels:
+        if alpha is None and sigma2 <= 0:
+            outputs[level] = image
+            continue
+        outputs[level] = _apply_level(image, base, max_val, alpha, sigma2,
+                                      noise_rng(seed, image_id, level), normal, lock_channels)
+    return outputs
+
+
+def add_poisson_gaussian_noise(image, alpha, sigma2, lock_channels=True, rng=None):
+    """单档噪声，直接使用给定的 Generator（不指定时用新的随机种子）。"""
+    rng = np.random.default_rng() if rng is None else rng
+    if alpha is None and sigma2 <= 0:
+        return image
+    base, max_val = _normalize(image, lock_channels)
+    return _apply_level(image, base, max_val, alpha, sigma2, rng,
+                        lambda: rng.standard_normal(size=base.shape, dtype=np.float32), lock_channels)
+
+
+class NoiseAugment:
+    """加载时按 (image_id, level, seed) 施加噪声的增强函数，结果确定且与磁盘上生成的版本一致。
+
+    aug = NoiseAugment("moderate", seed=0); noisy = aug(image, image_id)
+    "none" 级别原样返回输入数组（不复制）。
+    """
+
+    def __init__(self, level, seed=0, lock_channels=True, levels=NOISE_LEVELS):
+        if level not in levels:
+            raise ValueError(f"未知的噪声级别: {level}（可选 {', '.join(levels)}）")
+        self.level = level
+        self.seed = seed
+        self.lock_channels = lock_channels
+        self.alpha, self.sigma2 = levels[level]
+
+    def __call__(self, image, image_id):
+        return add_noise_levels(image, [(self.level, self.alpha, self.sigma2)], self.seed, image_id,
+                                self.lock_channels)[self.level]
+
+
+def list_images(input_dir):
+    """按固定顺序遍历输入目录，返回相对路径列表。"""
+    files = []
+    for root, dirs, names in os.walk(input_dir):
+        dirs.sort()
+        for filename in sorted(names):
+            # 检查文件扩展名，确保是图像格式
+            if filename.lower().endswith(image_exts):
+                files.append(os.path.relpath(os.path.join(root, filename), input_dir))
+    return files
+
+
+class NoisyImageDataset:
+    """目录中每张图像 × 每个噪声级别的按需加载数据集，不在磁盘上生成噪声副本。
+
+    第 i 项为 (image, rel_path, level)，顺序为 文件 × 级别；image_id 即相对路径，
+    与 x-ray-process.py 生成的文件一一对应。可直接作为 map-style 数据集交给训练/评估的 loader。
+    """
+
+    def __init__(self, image_dir, levels=("none", "mild", "moderate", "severe"), seed=0,
+                 flags=cv2.IMREAD_UNCHANGED, lock_channels=True):
+        self.image_dir = image_dir
+        self.files = list_images(image_dir)
+        self.augments = [NoiseAugment(level, seed, lock_channels) for level in levels]
+        self.flags = flags
+
+    def __len__(self):
+        return len(self.files) * len(self.augments)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        rel_path = self.files[index // len(self.augments)]
+        augment = self.augments[index % len(self.augments)]
+        image = cv2.imread(os.path.join(self.image_dir, rel_path), self.flags)
+        if image is None:
+            raise IOError(f"无法读取图像: {rel_path}")
+        return augment(image, rel_path), rel_path, augment.level
@@ -0,0 +1,47 @@
+import os
+from collections import Counter
+import cv2
+from tools.label_store import format_yolo_lines
+
+# 标签行统一成 YOLO 文本：LabelStore 记录数组直接格式化，文本行原样拼接
+def _label_text(labels):
+    if hasattr(labels, "dtype"):
+        lines = format_yolo_lines(labels)
+    else:
+        lines = [" ".join(str(v) for v in parts) for parts in labels if parts]
+    return "\n".join(lines) + "\n" if lines else ""
+
+class YoloSplitSink:
+    """流水线终点：把 (样本名, 图像, 标签) 按 assign_group 直接写入最终的 YOLO 目录。
+
+    每个样本只编码、写盘一次，不再经过中间目录和 copy_and_split 的二次复制。
+    """
+
+    def __init__(self, output_image_dir, output_label_dir, assign_group, subsets=("train", "test", "valid")):
+        self.output_image_dir = output_image_dir
+        self.output_label_dir = output_label_dir
+        self.assign_group = assign_group
+        self.counts = Counter()
+        for subset in subsets:
+            os.makedirs(os.path.join(output_image_dir, subset), exist_ok=True)
+            os.makedirs(os.path.join(output_label_dir, subset), exist_ok=True)
+
+    def write(self, base, img, labels):
+        subset = self.assign_group(base.split("_")[0])
+        if subset is None:
+            print(f"⚠️ 警告: 未知编号 {base}, 跳过。")
+            self.counts["skipped"] += 1
+            return None
+        cv2.imwrite(os.path.join(self.output_image_dir, subset, base + ".png"), img)
+        with open(os.path.join(self.output_label_dir, subset, base + ".txt"), 'w') as f:
+            f.write(_label_text(labels))
+        self.counts[subset] += 1
+        return subset
+
+    def consume(self, stream):
+        for base, img, labels in stream:
+            subset = self.write(base, img, labels)
+            if subset is not None:
+                print(f"[OK] {subset}/{base}.png")
+        print("✅ 流式生成完成！ " + ", ".join(f"{k}: {v}" for k, v in sorted(self.counts.items())))
+        return self.counts
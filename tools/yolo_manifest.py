@@ -0,0 +1,92 @@
+import os
+from collections import defaultdict
+import numpy as np
+
+image_exts = (".jpg", ".jpeg", ".png")
+
+# 默认类别名：0=bright, 1=gray
+CLASS_NAMES = {0: "bright", 1: "gray"}
+
+# 按编号前缀分组（与 copy_and_split 的规则一致：9_14.png → 9）
+def group_files_by_id(image_dir):
+    groups = defaultdict(list)
+    for f in sorted(os.listdir(image_dir)):
+        if not f.lower().endswith(image_exts):
+            continue
+        base_name = f.split('_')[0] if "_" in f else os.path.splitext(f)[0]
+        groups[base_name].append(f)
+    return groups
+
+# 固定编号分组 → 一个划分定义
+def fixed_split(train_ids, test_ids, valid_ids):
+    return {"train": set(train_ids), "val": set(valid_ids), "test": set(test_ids)}
+
+def kfold_splits(ids, k, seed=0, test_ids=()):
+    """把 ids（去掉 test_ids）随机均分为 k 折，返回 [(名称, 划分定义), ...]。
+
+    第 i 折作为 val，其余作为 train；test_ids 在每一折中都固定作为 test，不参与交叉验证。
+    """
+    test_ids = set(test_ids)
+    pool = np.array(sorted(set(ids) - test_ids))
+    order = np.random.default_rng(seed).permutation(len(pool))
+    folds = np.array_split(pool[order], k)
+    splits = []
+    for i in range(k):
+        val = set(folds[i].tolist())
+        train = set(pool.tolist()) - val
+        splits.append((f"fold_{i}", {"train": train, "val": val, "test": set(test_ids)}))
+    return splits
+
+def link_pool(image_dir, label_dir, pool_dir):
+    """建立共享样本池 pool_dir/images、pool_dir/labels（目录符号链接，不复制文件）。
+
+    YOLO 按路径中的 /images/ → /labels/ 查找标签，生成目录本身不满足这个约定，
+    所以清单里的路径都指向这个池。
+    """
+    os.makedirs(pool_dir, exist_ok=True)
+    for name, target in (("images", image_dir), ("labels", label_dir)):
+        link = os.path.join(pool_dir, name)
+        target = os.path.abspath(target)
+        if os.path.islink(link):
+            if os.readlink(link) == target:
+                continue
+            os.remove(link)
+        elif os.path.exists(link):
+            raise FileExistsError(f"{link} 已存在且不是符号链接")
+        os.symlink(target, link, target_is_directory=True)
+    return os.path.join(pool_dir, "images")
+
+def write_split_manifests(pool_image_dir, groups, split, out_dir, names=CLASS_NAMES):
+    """写出 train.txt / val.txt / test.txt（图像绝对路径列表）和 data.yaml，返回各子集数量。"""
+    os.makedirs(out_dir, exist_ok=True)
+    pool_image_dir = os.path.abspath(pool_image_dir)
+    counts = {}
+    for subset, ids in split.items():
+        id_names = sorted((b for b in groups if b.isdigit() and int(b) in ids), key=int)
+        paths = [os.path.join(pool_image_dir, f) for b in id_names for f in groups[b]]
+        with open(os.path.join(out_dir, f"{subset}.txt"), 'w') as f:
+            f.write("\n".join(paths) + "\n" if paths else "")
+        counts[subset] = len(paths)
+
+    with open(os.path.join(out_dir, "data.yaml"), 'w') as f:
+        f.write(f"path: {os.path.abspath(out_dir)}\n")
+        for subset in split:
+            f.write(f"{subset}: {subset}.txt\n")
+        f.write("names:\n")
+        for cls, name in sorted(names.items()):
+            f.write(f"  {cls}: {name}\n")
+    return counts
+
+def write_virtual_splits(image_dir, label_dir, manifest_dir, train_ids, test_ids, valid_ids, kfold=0, seed=0):
+    """只写清单的划分：共享一个样本池，每种划分定义一个子目录（fixed 或 fold_i）。"""
+    pool_image_dir = link_pool(image_dir, label_dir, os.path.join(manifest_dir, "pool"))
+    groups = group_files_by_id(pool_image_dir)
+    if kfold > 1:
+        all_ids = set(train_ids) | set(valid_ids) | set(test_ids)
+        splits = kfold_splits(all_ids, kfold, seed=seed, test_ids=test_ids)
+    else:
+        splits = [("fixed", fixed_split(train_ids, test_ids, valid_ids))]
+    for name, split in splits:
+        counts = write_split_manifests(pool_image_dir, groups, split, os.path.join(manifest_dir, name))
+        print(f"✅ {name}: " + ", ".join(f"{k} {v} images" for k, v in counts.items()))
+    return [name for name, _ in splits]